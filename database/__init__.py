@@ -11,17 +11,18 @@ DATABASE_URL = config('DATABASE_URL')
 engine = create_engine(
     DATABASE_URL,
     echo=False,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: после commit объекты не перечитываются из БД при каждом обращении
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
     db = SessionLocal()
     try:
-        db.expire_all()
         yield db
     finally:
         db.close()
\ No newline at end of file
@@ -2,13 +2,23 @@ from venv import logger
 
 from aiogram.contrib.middlewares import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, update, select, func, desc
-from typing import Optional, List, Tuple
+from sqlalchemy import and_, or_, update, select, insert, func, desc, bindparam
+from typing import Optional, List, Tuple, Dict, Iterable
 from datetime import datetime, date, timedelta
 import database.models as models
 from .models import ModerationLog, ModerationAction
+from database import priv_cache
 from database.models import User
 
+# Поиск TelegramUser по telegram_id: запрос собирается один раз
+_TG_USER_BY_TELEGRAM_ID = select(models.TelegramUser).where(
+    models.TelegramUser.telegram_id == bindparam('telegram_id')
+).limit(1)
+_TG_USER_COINS = select(models.TelegramUser.coins).where(
+    models.TelegramUser.telegram_id == bindparam('telegram_id')
+).limit(1)
+
+
 class UserRepository:
     @staticmethod
     def get_or_create_user(db: Session, tg_id: int, chat_id: int, username: str = "") -> User:
@@ -90,7 +100,23 @@ class UserRepository:
 
     @staticmethod
     def get_user_by_telegram_id(db: Session, telegram_id: int) -> Optional[models.TelegramUser]:
-        return db.query(models.TelegramUser).filter(models.TelegramUser.telegram_id == telegram_id).first()
+        # Заранее собранный запрос по индексу telegram_id; уже загруженная строка
+        # вернётся тем же объектом из identity map сессии
+        return db.execute(_TG_USER_BY_TELEGRAM_ID, {'telegram_id': telegram_id}).scalars().first()
+
+    @staticmethod
+    def get_coins(db: Session, telegram_id: int) -> Optional[int]:
+        """Баланс пользователя одним столбцом, без загрузки всей строки; None — пользователя нет"""
+        return db.execute(_TG_USER_COINS, {'telegram_id': telegram_id}).scalar()
+
+    @staticmethod
+    def get_users_by_telegram_ids(db: Session, telegram_ids: Iterable[int]) -> Dict[int, models.TelegramUser]:
+        """Загружает пользователей одним запросом WHERE telegram_id IN (...)"""
+        telegram_ids = set(telegram_ids)
+        if not telegram_ids:
+            return {}
+        users = db.query(models.TelegramUser).filter(models.TelegramUser.telegram_id.in_(telegram_ids)).all()
+        return {user.telegram_id: user for user in users}
 
     @staticmethod
     def update_user_balance(db: Session, telegram_id: int, coins: int) -> Optional[models.TelegramUser]:
@@ -191,6 +217,17 @@ class UserRepository:
             return user
         return None
 
+    @staticmethod
+    def apply_bets(db: Session, telegram_id: int, new_balance: int, max_bet: int) -> Optional[models.TelegramUser]:
+        """Списывает ставки одним UPDATE: новый баланс и максимальная ставка, если она выросла"""
+        user = UserRepository.get_user_by_telegram_id(db, telegram_id)
+        if user:
+            user.coins = new_balance
+            if max_bet > (user.max_bet or 0):
+                user.max_bet = max_bet
+            db.commit()
+        return user
+
     @staticmethod
     def create_user_safe(db: Session, telegram_id: int, first_name: str, username: str = None,
                          last_name: str = None, **kwargs) -> models.TelegramUser:
@@ -945,6 +982,19 @@ class RouletteRepository:
         db.refresh(transaction)
         return transaction
 
+    @staticmethod
+    def create_roulette_transactions(db: Session, rows: List[Dict], commit: bool = True) -> None:
+        """Пакетная запись транзакций: один executemany INSERT вместо INSERT и refresh на каждую ставку.
+
+        rows — словари с ключами user_id, amount, is_win, bet_type, bet_value, result_number, profit.
+        commit=False оставляет фиксацию вызывающему (запись вместе с балансами спина).
+        """
+        if not rows:
+            return
+        db.execute(insert(models.RouletteTransaction), rows)
+        if commit:
+            db.commit()
+
     @staticmethod
     def get_user_bet_history(db: Session, user_id: int, limit: int = 10) -> List[models.RouletteTransaction]:
         return db.query(models.RouletteTransaction).filter(
@@ -963,6 +1013,18 @@ class RouletteRepository:
         db.refresh(log)
         return log
 
+    @staticmethod
+    def add_game_logs(db: Session, rows: List[Dict], commit: bool = True) -> None:
+        """Пакетная запись логов игр одним executemany INSERT.
+
+        rows — словари с ключами chat_id, result, color_emoji, created_at.
+        """
+        if not rows:
+            return
+        db.execute(insert(models.RouletteGameLog), rows)
+        if commit:
+            db.commit()
+
     @staticmethod
     def get_recent_game_logs(db: Session, chat_id: int, limit: int = 10) -> List[models.RouletteGameLog]:
         return db.query(models.RouletteGameLog).filter(
@@ -1009,6 +1071,7 @@ class ShopRepository:
         db.add(purchase)
         db.commit()
         db.refresh(purchase)
+        priv_cache.invalidate(user_id)
         return purchase
 
     @staticmethod
@@ -1076,6 +1139,7 @@ class ShopRepository:
                 models.UserPurchase.item_id == item_id
             ).delete()
             db.commit()
+            priv_cache.invalidate(user_id)
             return result > 0
         except Exception as e:
             db.rollback()
@@ -1098,6 +1162,7 @@ class ShopRepository:
             else:
                 purchase.expires_at += timedelta(days=days)
             db.commit()
+            priv_cache.invalidate(user_id)
             return True
         return False
 
@@ -377,4 +377,22 @@ class User(Base):
     defeat_coins = Column(Integer, default=0)
     max_win_coins = Column(Integer, default=0)
     min_win_coins = Column(Integer, default=0)   # ← важно: default=0, не NULL
-    max_bet_coins = Column(Integer, default=0)
\ No newline at end of file
+    max_bet_coins = Column(Integer, default=0)
+
+    # Индексы под топы: ORDER BY ... LIMIT и подсчёт места идут по индексу
+    __table_args__ = (
+        Index('ix_users_chat_coins', 'chat_id', 'coins'),
+        Index('ix_users_chat_max_win', 'chat_id', 'max_win_coins'),
+        Index('ix_users_chat_min_win', 'chat_id', 'min_win_coins'),
+        Index('ix_users_chat_max_bet', 'chat_id', 'max_bet_coins'),
+    )
+
+class TopSnapshot(Base):
+    """Снимок топа чата: пересчитывается после прокрута рулетки, а не на каждый /топ"""
+    __tablename__ = 'top_snapshot'
+    chat_id = Column(BigInteger, primary_key=True)
+    category = Column(String(20), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    tg_id = Column(BigInteger, nullable=False)
+    username = Column(String)
+    value = Column(BigInteger, nullable=False)
@@ -0,0 +1,46 @@
+# database/priv_cache.py
+"""Кэш активных привилегий пользователей (user_purchases) с коротким TTL.
+
+Покупки меняются редко, а проверяются на каждом прокруте рулетки и каждой краже.
+Записи сбрасываются через invalidate() при покупке, продлении или удалении привилегии.
+"""
+import threading
+import time
+from typing import Dict, FrozenSet, Tuple
+
+PRIVILEGE_TTL = 60  # секунд
+MAX_ENTRIES = 10000  # при превышении вычищаются истёкшие записи
+
+# user_id -> (активные item_id, момент истечения по time.monotonic())
+_cache: Dict[int, Tuple[FrozenSet[int], float]] = {}
+_lock = threading.Lock()
+
+
+def get_active_purchases_cached(db, user_id: int, ttl: float = PRIVILEGE_TTL) -> FrozenSet[int]:
+    """Возвращает множество ID активных покупок пользователя, обращаясь к БД не чаще раза в ttl секунд"""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+    if entry is not None and entry[1] > now:
+        return entry[0]
+
+    from database.crud import ShopRepository
+    active = frozenset(ShopRepository.get_active_purchases(db, user_id))
+    with _lock:
+        if len(_cache) >= MAX_ENTRIES:
+            for stale_id in [uid for uid, (_, expires_at) in _cache.items() if expires_at <= now]:
+                del _cache[stale_id]
+        _cache[user_id] = (active, now + ttl)
+    return active
+
+
+def invalidate(user_id: int) -> None:
+    """Сбрасывает кэш привилегий пользователя (после изменения его покупок)"""
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def clear() -> None:
+    """Полностью очищает кэш привилегий"""
+    with _lock:
+        _cache.clear()
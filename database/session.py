@@ -7,7 +7,6 @@ def db_session():
     """Безопасный контекстный менеджер для работы с БД"""
     db = SessionLocal()
     try:
-        db.expire_all()
         yield db
         db.commit()
     except Exception as e:
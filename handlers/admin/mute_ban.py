@@ -20,12 +20,26 @@ ADMIN_IDS: List[int] = [6090751674, 1054684037]
 
 logger = logging.getLogger(__name__)
 
+# Права не меняются между вызовами — создаём объекты один раз
+_MUTE_PERMS = types.ChatPermissions(
+    can_send_messages=False,
+    can_send_media_messages=False,
+    can_send_other_messages=False,
+    can_add_web_page_previews=False
+)
+_UNMUTE_PERMS = types.ChatPermissions(
+    can_send_messages=True,
+    can_send_media_messages=True,
+    can_send_other_messages=True,
+    can_add_web_page_previews=True
+)
+
 
 class MuteBanManager:
     """Менеджер модерации: mute/ban/kick с проверкой админов и логированием"""
 
     def __init__(self):
-        self.active_mutes = {}  # chat_id -> {user_id: unmute_time}
+        self.active_mutes = {}  # (chat_id, user_id) -> unmute_time
         self.logger = logger
         self.bot = None
         self.pool = None  # Добавьте это поле
@@ -96,13 +110,7 @@ class MuteBanManager:
     ) -> bool:
         try:
             until_date = datetime.utcnow() + timedelta(minutes=duration_minutes)
-            permissions = types.ChatPermissions(
-                can_send_messages=False,
-                can_send_media_messages=False,
-                can_send_other_messages=False,
-                can_add_web_page_previews=False
-            )
-            await bot.restrict_chat_member(chat_id, user_id, permissions, until_date=until_date)
+            await bot.restrict_chat_member(chat_id, user_id, _MUTE_PERMS, until_date=until_date)
 
             # Лог в БД
             db = next(get_db())
@@ -120,9 +128,7 @@ class MuteBanManager:
                 db.close()
 
             # Сохраняем для автоматического снятия
-            if chat_id not in self.active_mutes:
-                self.active_mutes[chat_id] = {}
-            self.active_mutes[chat_id][user_id] = until_date
+            self.active_mutes[(chat_id, user_id)] = until_date
 
             self.logger.info(f"🔇 {user_id} замучен в {chat_id} на {duration_minutes} мин админом {admin_id}")
             return True
@@ -205,28 +211,20 @@ class MuteBanManager:
         while True:
             now = datetime.utcnow()
             to_remove = []
-            for chat_id, mutes in list(self.active_mutes.items()):
-                for user_id, unmute_time in list(mutes.items()):
-                    if now >= unmute_time:
-                        try:
-                            # Восстанавливаем права
-                            perms = types.ChatPermissions(
-                                can_send_messages=True,
-                                can_send_media_messages=True,
-                                can_send_other_messages=True,
-                                can_add_web_page_previews=True
-                            )
-                            await bot.restrict_chat_member(chat_id, user_id, perms)
-                            self.logger.info(f"🔈 Автоматический анмут {user_id} в {chat_id}")
-                        except Exception as e:
-                            self.logger.warning(f"⚠️ Не удалось размутить {user_id} в {chat_id}: {e}")
-                        to_remove.append((chat_id, user_id))
+            for key, unmute_time in list(self.active_mutes.items()):
+                if now >= unmute_time:
+                    chat_id, user_id = key
+                    try:
+                        # Восстанавливаем права
+                        await bot.restrict_chat_member(chat_id, user_id, _UNMUTE_PERMS)
+                        self.logger.info(f"🔈 Автоматический анмут {user_id} в {chat_id}")
+                    except Exception as e:
+                        self.logger.warning(f"⚠️ Не удалось размутить {user_id} в {chat_id}: {e}")
+                    to_remove.append(key)
 
             # Очистка
-            for chat_id, user_id in to_remove:
-                self.active_mutes[chat_id].pop(user_id, None)
-                if not self.active_mutes[chat_id]:
-                    self.active_mutes.pop(chat_id, None)
+            for key in to_remove:
+                self.active_mutes.pop(key, None)
 
             await asyncio.sleep(30)
 
@@ -742,6 +742,19 @@ class BotSearchHandler:
             await message.reply("❌ Ошибка при получении статистики.")
 
 
+def _is_logged_command(text: str) -> bool:
+    """Проверяет, нужно ли логировать команду (text.lower() считается один раз)"""
+    if not text:
+        return False
+    if text.startswith('/'):
+        return True
+
+    text_lower = text.lower()
+    if text_lower in COMMANDS_TO_LOG:
+        return True
+    return any(text_lower.startswith(cmd + ' ') for cmd in COMMANDS_TO_LOG)
+
+
 # ТОЧНЫЕ функции проверки команд
 def _is_exact_search_command(text: str) -> bool:
     """Проверяет, является ли сообщение ТОЧНОЙ командой поиска"""
@@ -826,11 +839,7 @@ def register_bot_search_handlers(dp: Dispatcher):
     # Логируем только команды из списка для сбора данных
     dp.register_message_handler(
         handler.log_user_command,
-        lambda msg: msg.text and (
-                msg.text.startswith('/') or
-                any(msg.text.lower().startswith(cmd + ' ') for cmd in COMMANDS_TO_LOG) or
-                msg.text.lower() in COMMANDS_TO_LOG
-        ),
+        lambda msg: _is_logged_command(msg.text),
         state="*",
         content_types=types.ContentTypes.TEXT,
         run_task=True
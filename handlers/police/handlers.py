@@ -1,5 +1,7 @@
 # handlers/police/handlers.py
+import asyncio
 import re
+import weakref
 from datetime import datetime, timedelta  # ← добавь timedelta сюда
 from datetime import datetime
 from aiogram import types
@@ -7,6 +9,18 @@ from database import get_db
 from datetime import datetime
 from handlers.police.service import PoliceService
 
+# Блокировки арестов по target_id: аресты одной цели идут последовательно,
+# разные цели не блокируют друг друга. Неиспользуемые локи удаляет GC.
+_arrest_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _lock_for(user_id: int) -> asyncio.Lock:
+    lock = _arrest_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _arrest_locks[user_id] = lock
+    return lock
+
 
 def normalize_cmd(text: str) -> str:
     """Нормализует команду, обрабатывая пустые строки"""
@@ -48,17 +62,18 @@ async def arrest_user(message: types.Message):
             await message.reply("🎭 Цель не является <b>Вором в законе</b>!", parse_mode="HTML")
             return
 
-        can, cooldown_end = PoliceService.check_police_cooldown(police.id)
-        if not can:
-            left = cooldown_end - datetime.now()
-            secs = int(left.total_seconds())
-            h, m = divmod(secs // 60, 60)
-            cd = f"{h}ч {m}м" if h else f"{m}м"
-            await message.reply(f"⏳ КД: следующий арест через {cd}")
-            return
+        async with _lock_for(target.id):
+            can, cooldown_end = PoliceService.check_police_cooldown(police.id)
+            if not can:
+                left = cooldown_end - datetime.now()
+                secs = int(left.total_seconds())
+                h, m = divmod(secs // 60, 60)
+                cd = f"{h}ч {m}м" if h else f"{m}м"
+                await message.reply(f"⏳ КД: следующий арест через {cd}")
+                return
 
-        minutes = PoliceService.parse_arrest_time(message.text)
-        success, msg = PoliceService.arrest_user(police.id, target.id, minutes)
+            minutes = PoliceService.parse_arrest_time(message.text)
+            success, msg = PoliceService.arrest_user(police.id, target.id, minutes)
 
         if success:
             release_time = datetime.now() + timedelta(minutes=minutes)
@@ -81,8 +96,12 @@ async def arrest_user(message: types.Message):
 async def check_arrest(message: types.Message):
     target = message.reply_to_message.from_user if message.reply_to_message else message.from_user
 
+    # Быстрый путь: пользователя нет среди арестованных — БД не трогаем
+    if not PoliceService.maybe_arrested(target.id):
+        await message.reply(f"{target.full_name}: ✅ Свободен")
+        return
+
     # Получаем статус + данные об аресте
-    from handlers.police.service import PoliceService
     db = next(get_db())  # ← уже есть в файле, если добавил импорт
     try:
         # Получаем "сырую" запись об аресте (без авто-очистки)
@@ -95,6 +114,7 @@ async def check_arrest(message: types.Message):
         release_time_str = arrest.release_time.strftime('%H:%M')
         status = f"🔒 Арестован до: {release_time_str}"
     else:
+        PoliceService.forget_arrest(target.id)
         status = "✅ Свободен"
 
     await message.reply(f"{target.full_name}: {status}")
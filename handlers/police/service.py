@@ -1,9 +1,10 @@
 # handlers/police/service.py
 import re
 from datetime import datetime, timedelta
-from typing import Optional, Tuple
+from typing import Optional, Set, Tuple
 
 from database import get_db
+from database.session import db_session
 from database.crud import PoliceRepository, ShopRepository
 
 
@@ -15,6 +16,34 @@ class PoliceService:
     POLICE_PRIVILEGE_ID = 2
     THIEF_PRIVILEGE_ID = 1
 
+    # Кто сейчас (возможно) под арестом: загружается при старте и обновляется
+    # при аресте/освобождении, чтобы не ходить в БД за свободными пользователями
+    _arrested_ids: Set[int] = set()
+    _arrested_ids_loaded = False
+
+    @staticmethod
+    def load_arrested_ids() -> None:
+        """Загружает ID активных арестов из БД (вызывается при старте)"""
+        db = next(get_db())
+        try:
+            arrests = PoliceRepository.get_all_active_arrests(db)
+            PoliceService._arrested_ids = {a.user_id for a in arrests}
+            PoliceService._arrested_ids_loaded = True
+        finally:
+            db.close()
+
+    @staticmethod
+    def maybe_arrested(user_id: int) -> bool:
+        """False — пользователь точно свободен, True — нужна проверка в БД"""
+        if not PoliceService._arrested_ids_loaded:
+            return True
+        return user_id in PoliceService._arrested_ids
+
+    @staticmethod
+    def forget_arrest(user_id: int) -> None:
+        """Убирает пользователя из множества возможно арестованных (арест снят или истёк)"""
+        PoliceService._arrested_ids.discard(user_id)
+
     @staticmethod
     def parse_arrest_time(text: str) -> int:
         """Парсит 'арест 1д 2ч 30м' → минуты (макс. 1440)"""
@@ -64,30 +93,36 @@ class PoliceService:
             db.close()
 
     @staticmethod
-    def is_user_arrested(user_id: int) -> bool:
-        db = next(get_db())
-        try:
-            arrest = PoliceRepository.get_user_arrest(db, user_id)
-            if not arrest:
-                return False
-            if arrest.release_time <= datetime.now():
-                PoliceRepository.unarrest_user(db, user_id)
-                db.commit()
-                return False
-            return True
-        finally:
-            db.close()
+    def is_user_arrested(user_id: int, db=None) -> bool:
+        """Проверяет арест; истёкший арест снимается в той же транзакции.
+
+        С переданной сессией фиксация остаётся за вызывающим кодом.
+        """
+        if db is None:
+            with db_session() as db:
+                return PoliceService.is_user_arrested(user_id, db)
+
+        arrest = PoliceRepository.get_user_arrest(db, user_id)
+        if not arrest:
+            PoliceService.forget_arrest(user_id)
+            return False
+        if arrest.release_time <= datetime.now():
+            PoliceRepository.unarrest_user(db, user_id)
+            PoliceService.forget_arrest(user_id)
+            return False
+        return True
 
     @staticmethod
     def arrest_user(police_id: int, thief_id: int, minutes: int) -> Tuple[bool, str]:
         db = next(get_db())
         try:
-            if PoliceService.is_user_arrested(thief_id):
+            if PoliceService.is_user_arrested(thief_id, db):
                 return False, "⚠️ Пользователь уже арестован!"
 
             release = datetime.now() + timedelta(minutes=minutes)
             PoliceRepository.arrest_user(db, thief_id, police_id, release)
             db.commit()
+            PoliceService._arrested_ids.add(thief_id)
             return True, f"✅ Арест на {minutes} мин"
         except Exception as e:
             db.rollback()
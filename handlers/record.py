@@ -3,9 +3,13 @@ from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.dispatcher import Dispatcher
 from database import SessionLocal
-from database.models import User, TelegramUser
-from sqlalchemy import desc, func, or_
+from database.models import User, TopSnapshot
+from sqlalchemy import BigInteger, String, bindparam, delete, desc, func, insert, literal, null, or_, select, text, union_all
 import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 TOP_CATEGORIES = {
     'balance': 'топ богатеев 💰',
@@ -14,133 +18,337 @@ TOP_CATEGORIES = {
     'max_bet': 'макс. ставка 🎲'
 }
 
+TOP_FIELDS = {
+    'balance': User.coins,
+    'max_win': User.max_win_coins,
+    'max_loss': User.min_win_coins,
+    'max_bet': User.max_bet_coins
+}
 
-async def show_top_menu(message: types.Message):
-    is_private = message.chat.type == 'private'
 
-    # Если это группа/супергруппа, регистрируем всех участников чата
-    if not is_private:
-        await register_all_chat_users(message.chat.id, message.bot)
+def _build_top_query(order_col, category: str, limit: int, per_chat: bool):
+    """Собирает запрос топа один раз; chat_id передаётся как bind-параметр"""
+    stmt = select(User.tg_id, User.username, order_col)
+    if per_chat:
+        stmt = stmt.where(User.chat_id == bindparam('chat_id'))
+    # Для баланса показываем всех, для остальных категорий - только ненулевые значения
+    if category != 'balance':
+        stmt = stmt.where(order_col != 0)
+    return stmt.order_by(desc(order_col)).limit(limit)
+
+
+def _build_rank_columns(order_col, category: str, per_chat: bool):
+    """Значение пользователя и его место (COUNT тех, кто выше, + 1) как подзапросы.
+
+    Использует индекс (chat_id, колонка) вместо ROW_NUMBER() по всей таблице.
+    """
+    value_stmt = select(func.max(order_col)).where(User.tg_id == bindparam('user_id'))
+    count_stmt = select(func.count()).select_from(User)
+    if per_chat:
+        value_stmt = value_stmt.where(User.chat_id == bindparam('chat_id'))
+        count_stmt = count_stmt.where(User.chat_id == bindparam('chat_id'))
+    user_value = value_stmt.scalar_subquery()
+    count_stmt = count_stmt.where(order_col > user_value)
+    if category != 'balance':
+        count_stmt = count_stmt.where(order_col != 0)
+    return (count_stmt.scalar_subquery() + 1).label('rank'), user_value.label('value')
+
+
+def _user_rank(category: str, rank, value):
+    """(место, значение) или (None, None), если пользователь не участвует в топе"""
+    if value is None or (category != 'balance' and value == 0):
+        return None, None
+    return rank, value
+
+
+# Сколько мест хранится в снимке топа чата и сколько из них показывается
+SNAPSHOT_SIZE = 30
+CHAT_TOP_SIZE = 10
+
+# Готовые запросы по категориям: SQL не пересобирается на каждый вызов
+SNAPSHOT_QUERIES = {cat: _build_top_query(col, cat, SNAPSHOT_SIZE, True) for cat, col in TOP_FIELDS.items()}
+GLOBAL_TOP_QUERIES = {cat: _build_top_query(col, cat, 30, False) for cat, col in TOP_FIELDS.items()}
+GLOBAL_RANK_QUERIES = {cat: select(*_build_rank_columns(col, cat, False)) for cat, col in TOP_FIELDS.items()}
+
+# Слияние User с TelegramUser выполняет сама БД: без чтения строк в Python.
+# Ненулевые значения из telegram_users перекрывают значения в users (как `tg.x or user.x`).
+_MERGED_COLUMNS = {
+    'coins': "COALESCE(NULLIF(t.coins, 0), users.coins)",
+    'win_coins': "COALESCE(NULLIF(t.win_coins, 0), users.win_coins)",
+    'defeat_coins': "COALESCE(NULLIF(t.defeat_coins, 0), users.defeat_coins)",
+    'max_win_coins': "COALESCE(NULLIF(t.max_win_coins, 0), users.max_win_coins)",
+    'min_win_coins': "COALESCE(NULLIF(t.min_win_coins, 0), users.min_win_coins)",
+    'max_bet_coins': "COALESCE(NULLIF(t.max_bet, 0), users.max_bet_coins)",
+}
+
 
+def _build_merge_update(username_expr: str, scope: str):
+    """UPDATE users ... FROM telegram_users только для строк, где что-то изменилось.
+
+    Условие IS DISTINCT FROM не даёт переписывать совпадающие строки: в PostgreSQL
+    каждый UPDATE создаёт новую версию строки (мёртвый кортеж и запись в WAL).
+    """
+    columns = dict(_MERGED_COLUMNS, username=username_expr)
+    assignments = ",\n        ".join(f"{name} = {expr}" for name, expr in columns.items())
+    changed = "\n        OR ".join(f"users.{name} IS DISTINCT FROM {expr}" for name, expr in columns.items())
+    return text(f"""
+    UPDATE users SET
+        {assignments}
+    FROM telegram_users t
+    WHERE t.telegram_id = users.tg_id
+      AND {scope}
+      AND (
+        {changed}
+      )
+""")
+
+
+_UPDATE_USER_FROM_TG = _build_merge_update(
+    "COALESCE(NULLIF(:username, ''), NULLIF(t.username, ''), users.username)",
+    "users.tg_id = :tg_id AND users.chat_id = :chat_id",
+)
+
+# То же слияние для всех участников чата: снимок топа по TTL видит переводы, покупки и кражи
+_UPDATE_CHAT_USERS_FROM_TG = _build_merge_update(
+    "COALESCE(NULLIF(t.username, ''), users.username)",
+    "users.chat_id = :chat_id",
+)
+
+# Есть ли уже строка пользователя в чате: SELECT 1 без загрузки самой строки
+_USER_ROW_EXISTS = text("SELECT 1 FROM users WHERE tg_id = :tg_id AND chat_id = :chat_id LIMIT 1")
+
+# Создаёт запись в users, если её нет; данные берутся из telegram_users (или нули)
+_INSERT_USER_FROM_TG = text("""
+    INSERT INTO users (tg_id, chat_id, username, coins, win_coins, defeat_coins,
+                       max_win_coins, min_win_coins, max_bet_coins)
+    SELECT :tg_id, :chat_id,
+           COALESCE(NULLIF(:username, ''), NULLIF(t.username, ''), ''),
+           COALESCE(t.coins, 0), COALESCE(t.win_coins, 0), COALESCE(t.defeat_coins, 0),
+           COALESCE(t.max_win_coins, 0), COALESCE(t.min_win_coins, 0), COALESCE(t.max_bet, 0)
+    FROM (SELECT 1) AS one
+    LEFT JOIN telegram_users t ON t.telegram_id = :tg_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM users u WHERE u.tg_id = :tg_id AND u.chat_id = :chat_id
+    )
+""")
+
+
+def _build_top_menu(is_private: bool) -> InlineKeyboardMarkup:
     markup = InlineKeyboardMarkup(row_width=2)
-    buttons = [
+    markup.add(*[
         InlineKeyboardButton(text=name, callback_data=f'top_select:{key}:{int(is_private)}')
         for key, name in TOP_CATEGORIES.items()
-    ]
-    markup.add(*buttons)
-    await message.answer("📊 Какой топ вас интересует?", reply_markup=markup)
+    ])
+    return markup
 
 
-async def register_all_chat_users(chat_id: int, bot):
-    """Регистрирует всех участников чата в базе данных"""
-    db = SessionLocal()
-    try:
-        print(f"🔄 Начинаем регистрацию всех пользователей чата {chat_id}")
+# Меню топа не меняется: собираем обе версии (ЛС и группа) один раз
+_MENU_PRIVATE = _build_top_menu(True)
+_MENU_GROUP = _build_top_menu(False)
+
+# Кэш глобального топа: (None, category) -> (время, top_users); топ чата читается из снимка
+TOP_TTL = 15
+_TOP_CACHE = {}
+
+
+def _get_cached_top(key):
+    """Возвращает закэшированный топ или None, если записи нет или она устарела"""
+    entry = _TOP_CACHE.get(key)
+    if entry is None:
+        return None
+    ts, top_users = entry
+    if time.monotonic() - ts >= TOP_TTL:
+        del _TOP_CACHE[key]
+        return None
+    return top_users
+
+
+def _store_top(key, top_users):
+    _TOP_CACHE[key] = (time.monotonic(), top_users)
+
+
+# Время сборки снимка топа чата: chat_id -> monotonic(). Балансы меняют не только
+# прокруты (переводы, магазин, кражи), поэтому снимок старше SNAPSHOT_TTL пересобирается
+SNAPSHOT_TTL = 60
+_SNAPSHOT_TS = {}
+
+# Строка с местом пользователя помечается tg_id = -1 (настоящие id положительные)
+_RANK_MARKER = -1
+
+
+def _build_snapshot_with_rank(order_col, category: str):
+    """Снимок топа чата и место пользователя одним запросом (UNION ALL)"""
+    snapshot = select(
+        TopSnapshot.rank, TopSnapshot.tg_id, TopSnapshot.username, TopSnapshot.value
+    ).where(
+        TopSnapshot.chat_id == bindparam('chat_id'),
+        TopSnapshot.category == category
+    )
+    rank, value = _build_rank_columns(order_col, category, True)
+    rank_row = select(rank, literal(_RANK_MARKER, BigInteger), null().cast(String), value)
+    stmt = union_all(snapshot, rank_row)
+    return stmt.order_by(stmt.selected_columns.rank)
 
-        # Получаем список участников чата
+
+CHAT_TOP_WITH_RANK = {cat: _build_snapshot_with_rank(col, cat) for cat, col in TOP_FIELDS.items()}
+
+
+def _refresh_top_sync(chat_id: int, user_ids=None):
+    """Пересобирает снимок топа чата по всем категориям в одной транзакции (синхронно).
+
+    Сначала подтягивает в users свежие значения из telegram_users: только
+    указанных игроков или, без user_ids, всех участников чата; затем
+    перезаписывает top_snapshot.
+    """
+    with SessionLocal() as db:
         try:
-            chat_members = await bot.get_chat_administrators(chat_id)
-            # Добавляем обычных участников (админы уже в списке)
-            all_members_count = await bot.get_chat_members_count(chat_id)
-            print(f"👥 В чате {chat_id} всего участников: {all_members_count}")
+            if user_ids:
+                db.execute(_UPDATE_USER_FROM_TG, [
+                    {'tg_id': user_id, 'chat_id': chat_id, 'username': ''} for user_id in user_ids
+                ])
+            else:
+                db.execute(_UPDATE_CHAT_USERS_FROM_TG, {'chat_id': chat_id})
+
+            db.execute(delete(TopSnapshot).where(TopSnapshot.chat_id == chat_id))
+            rows = []
+            for category, query in SNAPSHOT_QUERIES.items():
+                for rank, (tg_id, username, value) in enumerate(db.execute(query, {'chat_id': chat_id}), start=1):
+                    rows.append({'chat_id': chat_id, 'category': category, 'rank': rank,
+                                 'tg_id': tg_id, 'username': username, 'value': value or 0})
+            if rows:
+                db.execute(insert(TopSnapshot), rows)
+            db.commit()
+            _SNAPSHOT_TS[chat_id] = time.monotonic()
         except Exception as e:
-            print(f"❌ Не удалось получить список участников чата: {e}")
-            return
+            logger.error(f"❌ Ошибка при обновлении снимка топа чата {chat_id}: {e}")
+            db.rollback()
 
-        registered_count = 0
-        processed_members = set()
 
-        # Обрабатываем администраторов (они уже в списке chat_members)
-        for member in chat_members:
-            if member.user.is_bot:
-                continue
+# Пересборки снимка одного чата идут строго по очереди: параллельные DELETE + INSERT
+# в READ COMMITTED конфликтуют по первичному ключу (chat_id, category, rank)
+_REFRESH_LOCKS = {}
 
-            user_id = member.user.id
-            if user_id in processed_members:
-                continue
 
-            processed_members.add(user_id)
-            await register_single_user(db, user_id, chat_id, member.user.username, member.user.first_name)
-            registered_count += 1
+def _refresh_lock(chat_id: int) -> asyncio.Lock:
+    lock = _REFRESH_LOCKS.get(chat_id)
+    if lock is None:
+        lock = _REFRESH_LOCKS[chat_id] = asyncio.Lock()
+    return lock
 
-            # Небольшая задержка чтобы не перегружать API
-            await asyncio.sleep(0.1)
 
-        print(f"✅ Зарегистрировано {registered_count} пользователей из чата {chat_id}")
+async def refresh_top(chat_id: int, user_ids=None):
+    """Пересобирает снимок топа чата; запросы к БД идут в пуле потоков, не блокируя цикл событий"""
+    async with _refresh_lock(chat_id):
+        await asyncio.to_thread(_refresh_top_sync, chat_id, user_ids)
 
-    except Exception as e:
-        print(f"❌ Ошибка при регистрации пользователей чата: {e}")
-    finally:
-        db.close()
 
+# Фоновые задачи топа: ссылки держатся до завершения, иначе задачу может собрать GC
+_BACKGROUND_TASKS = set()
 
-async def register_single_user(db, user_id: int, chat_id: int, username: str = None, first_name: str = None):
-    """Регистрирует одного пользователя в чате"""
-    try:
-        # Проверяем существующего пользователя в этом чате
-        user = db.query(User).filter(
-            User.tg_id == user_id,
-            User.chat_id == chat_id
-        ).first()
-
-        # Если пользователя нет в этом чате, создаем/обновляем запись
-        if not user:
-            # Ищем пользователя в таблице TelegramUser для копирования данных
-            telegram_user = db.query(TelegramUser).filter(
-                TelegramUser.telegram_id == user_id
-            ).first()
-
-            if telegram_user:
-                # Создаем пользователя с данными из TelegramUser
-                user = User(
-                    tg_id=user_id,
-                    chat_id=chat_id,
-                    username=username or telegram_user.username or "",
-                    coins=telegram_user.coins or 0,
-                    win_coins=telegram_user.win_coins or 0,
-                    defeat_coins=telegram_user.defeat_coins or 0,
-                    max_win_coins=telegram_user.max_win_coins or 0,
-                    min_win_coins=telegram_user.min_win_coins or 0,
-                    max_bet_coins=telegram_user.max_bet or 0
-                )
-                print(f"✅ Создан пользователь {user_id} в чате {chat_id} с балансом {user.coins}")
-            else:
-                # Если пользователя нет в TelegramUser, создаем нового с нулями
-                user = User(
-                    tg_id=user_id,
-                    chat_id=chat_id,
-                    username=username or "",
-                    coins=0,
-                    win_coins=0,
-                    defeat_coins=0,
-                    max_win_coins=0,
-                    min_win_coins=0,
-                    max_bet_coins=0
-                )
-                print(f"✅ Создан новый пользователь {user_id} в чате {chat_id}")
-
-            db.add(user)
+
+def _on_background_done(task: asyncio.Task):
+    _BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ Ошибка фоновой задачи топа {task.get_name()}: {task.exception()}")
+
+
+def _run_in_background(coro, name: str) -> asyncio.Task:
+    """Запускает корутину в фоне, сохраняя ссылку на задачу и логируя её ошибку"""
+    task = asyncio.create_task(coro, name=name)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+def schedule_refresh_top(chat_id: int, user_ids=None) -> asyncio.Task:
+    """Запускает пересборку снимка топа чата в фоне (например, после прокрута рулетки)"""
+    return _run_in_background(refresh_top(chat_id, user_ids), f"refresh_top:{chat_id}")
+
+
+# Время последней синхронизации участников чата: chat_id -> monotonic()
+SYNC_TTL = 300
+_CHAT_SYNC_TS = {}
+
+
+async def _sync_chat_users(chat_id: int, bot):
+    """Регистрирует участников чата не чаще одного раза в SYNC_TTL секунд"""
+    now = time.monotonic()
+    if now - _CHAT_SYNC_TS.get(chat_id, 0) <= SYNC_TTL:
+        return
+    _CHAT_SYNC_TS[chat_id] = now
+    await register_all_chat_users(chat_id, bot)
+
+
+async def show_top_menu(message: types.Message):
+    is_private = message.chat.type == 'private'
+
+    # Если это группа/супергруппа, регистрируем всех участников чата в фоне
+    if not is_private:
+        _run_in_background(_sync_chat_users(message.chat.id, message.bot), f"sync_chat_users:{message.chat.id}")
+
+    markup = _MENU_PRIVATE if is_private else _MENU_GROUP
+    await message.answer("📊 Какой топ вас интересует?", reply_markup=markup)
+
+
+async def register_all_chat_users(chat_id: int, bot):
+    """Регистрирует всех участников чата в базе данных (пакетно, один commit)"""
+    with SessionLocal() as db:
+        try:
+            # Получаем список участников чата
+            try:
+                chat_members = await bot.get_chat_administrators(chat_id)
+                # Добавляем обычных участников (админы уже в списке)
+                all_members_count = await bot.get_chat_members_count(chat_id)
+                logger.debug("В чате %d всего участников: %d", chat_id, all_members_count)
+            except Exception as e:
+                logger.error(f"❌ Не удалось получить список участников чата: {e}")
+                return
+
+            members = {}
+            for member in chat_members:
+                if not member.user.is_bot:
+                    members.setdefault(member.user.id, member.user)
+            if not members:
+                return
+
+            params = [
+                {'tg_id': user_id, 'chat_id': chat_id, 'username': member_user.username or ''}
+                for user_id, member_user in members.items()
+            ]
+            db.execute(_UPDATE_USER_FROM_TG, params)
+            db.execute(_INSERT_USER_FROM_TG, params)
             db.commit()
-        else:
-            # Если пользователь уже существует в этом чате, обновляем его данные из TelegramUser
-            telegram_user = db.query(TelegramUser).filter(
-                TelegramUser.telegram_id == user_id
-            ).first()
-
-            if telegram_user:
-                # Обновляем данные из TelegramUser
-                user.coins = telegram_user.coins or user.coins
-                user.win_coins = telegram_user.win_coins or user.win_coins
-                user.defeat_coins = telegram_user.defeat_coins or user.defeat_coins
-                user.max_win_coins = telegram_user.max_win_coins or user.max_win_coins
-                user.min_win_coins = telegram_user.min_win_coins or user.min_win_coins
-                user.max_bet_coins = telegram_user.max_bet or user.max_bet_coins
-                user.username = username or telegram_user.username or user.username
-                db.commit()
-                print(f"✅ Обновлены данные пользователя {user_id} в чате {chat_id}")
 
+            logger.info("Зарегистрировано %d пользователей из чата %d", len(members), chat_id)
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка при регистрации пользователей чата: {e}")
+            db.rollback()
+            return
+
+    # Новые участники могли попасть в топ
+    await refresh_top(chat_id)
+
+
+def sync_user_row(db, user_id: int, chat_id: int, username: str = None):
+    """Создаёт строку users или подтягивает в неё telegram_users, не фиксируя транзакцию.
+
+    Ошибки не перехватываются: откат и фиксация остаются за вызывающим кодом.
+    """
+    params = {'tg_id': user_id, 'chat_id': chat_id, 'username': username or ''}
+    if db.execute(_USER_ROW_EXISTS, params).first() is None:
+        db.execute(_INSERT_USER_FROM_TG, params)
+    else:
+        db.execute(_UPDATE_USER_FROM_TG, params)
+
+
+async def register_single_user(db, user_id: int, chat_id: int, username: str = None, first_name: str = None):
+    """Регистрирует одного пользователя в чате (слияние с TelegramUser выполняет БД)"""
+    try:
+        sync_user_row(db, user_id, chat_id, username)
+        db.commit()
     except Exception as e:
-        print(f"❌ Ошибка при регистрации пользователя {user_id}: {e}")
+        logger.error(f"❌ Ошибка при регистрации пользователя {user_id}: {e}")
         db.rollback()
 
 
@@ -158,17 +366,14 @@ async def process_top_selection(callback: types.CallbackQuery):
     chat_id = callback.message.chat.id
     user_id = callback.from_user.id
 
-    # Если это группа, регистрируем всех пользователей чата
+    # Если это группа, регистрируем всех пользователей чата в фоне
     if not is_private:
-        await register_all_chat_users(chat_id, callback.bot)
+        _run_in_background(_sync_chat_users(chat_id, callback.bot), f"sync_chat_users:{chat_id}")
 
     # Регистрируем текущего пользователя
-    db = SessionLocal()
-    try:
+    with SessionLocal() as db:
         await register_single_user(db, user_id, 0 if is_private else chat_id,
                                    callback.from_user.username, callback.from_user.first_name)
-    finally:
-        db.close()
 
     # Получаем топ
     if is_private:
@@ -187,107 +392,65 @@ async def process_top_selection(callback: types.CallbackQuery):
         )
         return await callback.answer()
 
-    lines = [f"{title}:\n"]
-    for idx, (username, value) in enumerate(top_users, start=1):
-        name = (username or "Аноним")[:15]
-        display_value = abs(value) if category == 'max_loss' else value
-        lines.append(f"{idx}. {name} — {display_value:,}")
+    show = abs if category == 'max_loss' else int
+    text = f"{title}:\n\n" + "\n".join(
+        f"{idx}. {(username or 'Аноним')[:15]} — {show(value):,}"
+        for idx, (username, value) in enumerate(top_users, start=1)
+    )
 
     if user_rank is not None and user_value is not None:
-        user_name = (callback.from_user.full_name or "Аноним")[:15]
-        display_user_value = abs(user_value) if category == 'max_loss' else user_value
-        lines.append(f"\n🔽 Ваше место: #{user_rank} — {display_user_value:,}")
+        text += f"\n\n🔽 Ваше место: #{user_rank} — {show(user_value):,}"
 
-    await callback.message.edit_text("\n".join(lines), reply_markup=None)
+    await callback.message.edit_text(text, reply_markup=None)
     await callback.answer()
 
 
 async def get_top_with_user_rank(chat_id: int, user_id: int, category: str):
-    db = SessionLocal()
-    try:
-        db.expire_all()
-        field_map = {
-            'balance': User.coins,
-            'max_win': User.max_win_coins,
-            'max_loss': User.min_win_coins,
-            'max_bet': User.max_bet_coins
-        }
-        order_col = field_map[category]
-
-        # Исключаем нулевые значения для некоторых категорий
-        query = db.query(User.username, order_col).filter(User.chat_id == chat_id)
-
-        # Для баланса показываем всех, для остальных категорий - только ненулевые значения
-        if category != 'balance':
-            query = query.filter(order_col != 0)
-
-        top_query = query.order_by(desc(order_col)).limit(10).all()
-        top_users = [(u.username, getattr(u, order_col.key)) for u in top_query]
-
-        # Получаем ранг пользователя
-        subq = (
-            db.query(
-                User.tg_id,
-                order_col.label('val'),
-                func.row_number().over(order_by=desc(order_col)).label('rank')
-            )
-            .filter(User.chat_id == chat_id)
-        )
-        if category != 'balance':
-            subq = subq.filter(order_col != 0)
-
-        subq = subq.subquery()
-        user_row = db.query(subq.c.rank, subq.c.val).filter(subq.c.tg_id == user_id).first()
-
-        return top_users, (user_row[0] if user_row else None), (user_row[1] if user_row else None)
-    except Exception as e:
-        print(f"❌ Ошибка в get_top_with_user_rank: {e}")
-        return [], None, None
-    finally:
-        db.close()
+    snapshot_ts = _SNAPSHOT_TS.get(chat_id)
+    if snapshot_ts is None:
+        # Снимка ещё нет — собираем его сразу
+        await refresh_top(chat_id)
+    elif time.monotonic() - snapshot_ts >= SNAPSHOT_TTL and not _refresh_lock(chat_id).locked():
+        # Устаревший снимок отдаём как есть, а пересобираем в фоне
+        schedule_refresh_top(chat_id)
+
+    with SessionLocal() as db:
+        try:
+            # Снимок топа и место пользователя приходят одним запросом
+            rows = db.execute(CHAT_TOP_WITH_RANK[category], {'chat_id': chat_id, 'user_id': user_id}).all()
+            snapshot = [row for row in rows if row.tg_id != _RANK_MARKER]
+            top_users = [(row.username, row.value) for row in snapshot[:CHAT_TOP_SIZE]]
+
+            # Место пользователя из снимка, если он в первых SNAPSHOT_SIZE
+            for rank, row in enumerate(snapshot, start=1):
+                if row.tg_id == user_id:
+                    return top_users, rank, row.value
+
+            rank_row = next(row for row in rows if row.tg_id == _RANK_MARKER)
+            user_rank, user_value = _user_rank(category, rank_row.rank, rank_row.value)
+            return top_users, user_rank, user_value
+        except Exception as e:
+            logger.error(f"❌ Ошибка в get_top_with_user_rank: {e}")
+            return [], None, None
 
 
 async def get_global_top_with_user_rank(user_id: int, category: str):
-    db = SessionLocal()
-    try:
-        field_map = {
-            'balance': User.coins,
-            'max_win': User.max_win_coins,
-            'max_loss': User.min_win_coins,
-            'max_bet': User.max_bet_coins
-        }
-        order_col = field_map[category]
-
-        # Исключаем нулевые значения для некоторых категорий
-        query = db.query(User.username, order_col)
-
-        # Для баланса показываем всех, для остальных категорий - только ненулевые значения
-        if category != 'balance':
-            query = query.filter(order_col != 0)
-
-        top_query = query.order_by(desc(order_col)).limit(30).all()
-        top_users = [(u.username, getattr(u, order_col.key)) for u in top_query]
-
-        # Получаем ранг пользователя
-        subq = (
-            db.query(
-                User.tg_id,
-                order_col.label('val'),
-                func.row_number().over(order_by=desc(order_col)).label('rank')
-            )
-        )
-        if category != 'balance':
-            subq = subq.filter(order_col != 0)
+    with SessionLocal() as db:
+        try:
+            cache_key = (None, category)
+            top_users = _get_cached_top(cache_key)
+            if top_users is None:
+                top_users = [(username, value) for _, username, value in db.execute(GLOBAL_TOP_QUERIES[category])]
+                _store_top(cache_key, top_users)
 
-        subq = subq.subquery()
-        user_row = db.query(subq.c.rank, subq.c.val).filter(subq.c.tg_id == user_id).first()
+            # Значение (лучшая из записей по всем чатам) и место пользователя одним запросом
+            rank, value = db.execute(GLOBAL_RANK_QUERIES[category], {'user_id': user_id}).one()
+            user_rank, user_value = _user_rank(category, rank, value)
 
-        return top_users, (user_row[0] if user_row else None), (user_row[1] if user_row else None)
-    except Exception as e:
-        print(f"❌ Ошибка в get_global_top_with_user_rank: {e}")
-        return [], None, None
-    finally:
-        db.close()
+            return top_users, user_rank, user_value
+        except Exception as e:
+            logger.error(f"❌ Ошибка в get_global_top_with_user_rank: {e}")
+            return [], None, None
 
 
 def register_record_handlers(dp: Dispatcher):
@@ -1,13 +1,15 @@
-import binascii
-import os
+import logging
+import secrets
 from aiogram import types, Dispatcher
 from aiogram.utils.deep_linking import get_start_link
 from config import bot
-from database import get_db
+from database import SessionLocal
 from database.crud import UserRepository, ReferenceRepository
 from const import REFERENCE_MENU_TEXT, REFERENCE_LINK_TEXT
 from keyboards.reference_keyboard import reference_menu_keyboard
 
+logger = logging.getLogger(__name__)
+
 
 async def reference_menu_call(call: types.CallbackQuery):
     await bot.send_message(
@@ -19,54 +21,54 @@ async def reference_menu_call(call: types.CallbackQuery):
 
 
 async def reference_link_call(call: types.CallbackQuery):
-    db = next(get_db())
-    try:
-        user = UserRepository.get_user_by_telegram_id(db, call.from_user.id)
+    with SessionLocal() as db:
+        try:
+            user = UserRepository.get_user_by_telegram_id(db, call.from_user.id)
 
-        if not user or not user.reference_link:
-            token = binascii.hexlify(os.urandom(4)).decode()
-            link = await get_start_link(payload=token)
-            UserRepository.update_reference_link(db, call.from_user.id, link)
-        else:
-            link = user.reference_link
+            if not user or not user.reference_link:
+                token = secrets.token_hex(4)
+                link = await get_start_link(payload=token)
+                UserRepository.update_reference_link(db, call.from_user.id, link)
+            else:
+                link = user.reference_link
 
-        await bot.send_message(
-            chat_id=call.message.chat.id,
-            text=REFERENCE_LINK_TEXT.format(link=link)
-        )
-    except Exception as e:
-        print(f"❌ Ошибка создания реферальной ссылки: {e}")
-    finally:
-        db.close()
+            await bot.send_message(
+                chat_id=call.message.chat.id,
+                text=REFERENCE_LINK_TEXT.format(link=link)
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания реферальной ссылки: {e}")
 
 
-async def reference_list_call(call: types.CallbackQuery):
-    db = next(get_db())
-    try:
-        references = ReferenceRepository.get_user_references(db, call.from_user.id)
+def _reference_line(reference_telegram_id: int, user_data) -> str:
+    """Кликабельная ссылка на реферала"""
+    if user_data:
+        username = user_data.username or user_data.first_name or "Неизвестный"
+        return f"[{username}](tg://user?id={reference_telegram_id})"
+    return f"[Неизвестный пользователь](tg://user?id={reference_telegram_id})"
 
-        if references:
-            data = []
-            for ref in references:
-                # Получаем данные пользователя по ID
-                user_data = UserRepository.get_user_by_telegram_id(db, ref.reference_telegram_id)
-                if user_data:
-                    # Создаем кликабельную ссылку на пользователя
-                    username = user_data.username or user_data.first_name or "Неизвестный"
-                    data.append(f"[{username}](tg://user?id={ref.reference_telegram_id})")
-                else:
-                    data.append(f"[Неизвестный пользователь](tg://user?id={ref.reference_telegram_id})")
 
-            text = "👥 *Ваши рефералы:*\n\n" + '\n'.join(data)
-            await call.message.reply(text, parse_mode=types.ParseMode.MARKDOWN)
-        else:
-            await call.message.reply('У вас нет рефералов', parse_mode=types.ParseMode.MARKDOWN)
+async def reference_list_call(call: types.CallbackQuery):
+    with SessionLocal() as db:
+        try:
+            references = ReferenceRepository.get_user_references(db, call.from_user.id)
+
+            if references:
+                # Все рефералы одним запросом вместо SELECT на каждого
+                users = UserRepository.get_users_by_telegram_ids(
+                    db, (ref.reference_telegram_id for ref in references)
+                )
+                text = "👥 *Ваши рефералы:*\n\n" + '\n'.join(
+                    _reference_line(ref.reference_telegram_id, users.get(ref.reference_telegram_id))
+                    for ref in references
+                )
+                await call.message.reply(text, parse_mode=types.ParseMode.MARKDOWN)
+            else:
+                await call.message.reply('У вас нет рефералов', parse_mode=types.ParseMode.MARKDOWN)
 
-    except Exception as e:
-        print(f"❌ Ошибка получения списка рефералов: {e}")
-        await call.message.reply('❌ Ошибка при получении списка рефералов')
-    finally:
-        db.close()
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения списка рефералов: {e}")
+            await call.message.reply('❌ Ошибка при получении списка рефералов')
 
 
 def register_reference_handlers(dp: Dispatcher):
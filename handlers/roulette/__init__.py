@@ -1,4 +1,4 @@
 # Экспортируем нужные имена из handlers.py
-from .handlers import RouletteHandler, register_roulette_handlers
+from .handlers import RouletteHandler, register_roulette_handlers, shutdown_roulette_handlers
 
-__all__ = ["RouletteHandler", "register_roulette_handlers"]
\ No newline at end of file
+__all__ = ["RouletteHandler", "register_roulette_handlers", "shutdown_roulette_handlers"]
\ No newline at end of file
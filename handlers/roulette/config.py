@@ -1,7 +1,10 @@
 from dataclasses import dataclass
-from decimal import Decimal
 from typing import Dict, Tuple, Optional
 
+# Множители выплат хранятся целыми числами в тысячных: 4333 == x4.333
+PAYOUT_SCALE = 1000
+
+
 @dataclass(frozen=True)
 class RouletteConfig:
     MIN_BET: int = 1000
@@ -16,16 +19,16 @@ class RouletteConfig:
     NUMBERS: Tuple[int, ...] = tuple(range(0, 13))
     RED_NUMBERS: frozenset = frozenset({1, 3, 5, 7, 9, 11})
     BLACK_NUMBERS: frozenset = frozenset({2, 4, 6, 8, 10, 12})
-    PAYOUTS: Optional[Dict[str, Decimal]] = None
+    PAYOUTS: Optional[Dict[str, int]] = None  # множители в тысячных (PAYOUT_SCALE)
 
     def __post_init__(self):
         if self.PAYOUTS is None:
             object.__setattr__(self, 'PAYOUTS', {
-                "число": Decimal('12.0'),
-                "цвет_красное": Decimal('2.0'),
-                "цвет_черное": Decimal('2.0'),
-                "цвет_зеленое": Decimal('12.0'),
-                "группа_стандарт": Decimal('4.333')
+                "число": 12000,
+                "цвет_красное": 2000,
+                "цвет_черное": 2000,
+                "цвет_зеленое": 12000,
+                "группа_стандарт": 4333
             })
 
 CONFIG = RouletteConfig()
\ No newline at end of file
@@ -1,144 +1,215 @@
+import heapq
 import random
+import re
 import asyncio
+import time
 from datetime import datetime
-from decimal import Decimal, ROUND_DOWN
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Any
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from .config import CONFIG
+from .config import CONFIG, PAYOUT_SCALE
 from handlers.roulette_logs import RouletteLogger
 
 
+# Выигрышные числа ставки хранятся битовой маской: число n выигрывает, если бит n установлен
+_NO_WIN = 0
+
+
+def _mask(numbers) -> int:
+    mask = 0
+    for n in numbers:
+        mask |= 1 << n
+    return mask
+
+
+# Красные и чёрные числа упакованы в маски: принадлежность — сдвиг и &
+RED_MASK = _mask(CONFIG.RED_NUMBERS)
+BLACK_MASK = _mask(CONFIG.BLACK_NUMBERS)
+
+
+# Множители в тысячных, посчитанные один раз: по размеру диапазона и по цвету.
+# Целочисленное деление повторяет прежнее округление ROUND_DOWN.
+_RANGE_MULTIPLIERS = {count: CONFIG.PAYOUTS["число"] // count for count in range(1, len(CONFIG.NUMBERS) + 1)}
+_COLOR_MULTIPLIERS = {
+    color: CONFIG.PAYOUTS[f"цвет_{color}"] for color in ("красное", "черное", "зеленое")
+}
+
+
+# Проверки формата вместо try/except вокруг int()
+_INT_RE = re.compile(r"\s*\+?\d+\s*")
+_RANGE_RE = re.compile(r"\s*\+?(\d+)\s*-\s*\+?(\d+)\s*")
+
+
+@lru_cache(maxsize=64)
+def parse_range(value: str) -> Optional[Tuple[int, int]]:
+    """Разбирает диапазон "a-b" в (a, b); None, если это не допустимый диапазон 0..12"""
+    match = _RANGE_RE.fullmatch(value)
+    if not match:
+        return None
+    start, end = int(match.group(1)), int(match.group(2))
+    if 0 <= start <= 12 and 0 <= end <= 12 and start < end:
+        return start, end
+    return None
+
+
+@lru_cache(maxsize=256)
+def _parse_bet(bet_type: str, bet_value: Any) -> Tuple[int, int]:
+    """Медленный путь для ставок, которых нет в таблице: (маска выигрышных чисел, множитель)"""
+    if bet_type == "число":
+        # Парсеры ставок уже отдают int; строки принимаются только из цифр
+        if isinstance(bet_value, str) and _INT_RE.fullmatch(bet_value):
+            number = int(bet_value)
+        elif isinstance(bet_value, int):
+            number = bet_value
+        else:
+            return _NO_WIN, CONFIG.PAYOUTS["число"]
+        return (1 << number if 0 <= number <= 12 else _NO_WIN), CONFIG.PAYOUTS["число"]
+    if bet_type == "цвет":
+        return _NO_WIN, _COLOR_MULTIPLIERS.get(bet_value, PAYOUT_SCALE)
+    if bet_type == "группа":
+        bounds = parse_range(bet_value) if isinstance(bet_value, str) and '-' in bet_value else None
+        if bounds:
+            start, end = bounds
+            return _mask(range(start, end + 1)), _RANGE_MULTIPLIERS[end - start + 1]
+        return _NO_WIN, CONFIG.PAYOUTS["группа_стандарт"]
+    return _NO_WIN, PAYOUT_SCALE
+
+
+# Внутри игры цвета — целые коды; строки нужны только на выходе
+COLOR_RED, COLOR_BLACK, COLOR_GREEN = 0, 1, 2
+_COLOR_NAMES = ("красное", "черное", "зеленое")
+_COLOR_EMOJIS = ("🔴", "⚫", "🟢")
+
+
 class RouletteGame:
+    __slots__ = ('numbers', '_rng', '_rand_pool', '_rand_idx', '_std_group_idx', '_color_ids',
+                 '_color_table', '_emoji_table', '_pools', '_bets', '_current_color', '_current_streak',
+                 'max_same_color_streak')
+
+    _STREAK_FMT = "Текущая серия: {} ({} раз подряд)".format
+
     def __init__(self):
         self.numbers = CONFIG.NUMBERS
         self._rng = random.Random()
-        self.standard_groups = {
-            "1-3": {1, 2, 3}, "4-6": {4, 5, 6},
-            "7-9": {7, 8, 9}, "10-12": {10, 11, 12}
-        }
-        self.last_colors = []  # Хранит историю последних цветов
+        # Случайные байты берутся из заранее заполненного буфера
+        self._rand_pool = b""
+        self._rand_idx = 0
+        # Стандартные группы — тройки подряд с 1: номер группы = (число - 1) // 3
+        self._std_group_idx = {"1-3": 0, "4-6": 1, "7-9": 2, "10-12": 3}
+        # Таблицы цветов по номеру и пулы чисел без каждого из цветов считаются один раз
+        self._color_ids = tuple(
+            COLOR_GREEN if n == 0 else (COLOR_RED if (RED_MASK >> n) & 1 else COLOR_BLACK)
+            for n in range(max(self.numbers) + 1)
+        )
+        self._color_table = tuple(_COLOR_NAMES[color] for color in self._color_ids)
+        self._emoji_table = tuple(_COLOR_EMOJIS[color] for color in self._color_ids)
+        # Пул чисел без цвета с данным кодом
+        self._pools = tuple(
+            tuple(n for n in self.numbers if self._color_ids[n] != color) or self.numbers
+            for color in (COLOR_RED, COLOR_BLACK, COLOR_GREEN)
+        )
+        self._bets = self._build_bet_table()
+        # Текущая серия цветов ведётся счётчиком, без хранения истории
+        self._current_color: Optional[int] = None
+        self._current_streak = 0
         self.max_same_color_streak = 3  # Максимальное количество одинаковых цветов подряд
 
     def spin(self) -> int:
         """Генерирует число с учетом ограничения на одинаковые цвета подряд"""
-        # Преобразуем кортеж в список для работы с копией
-        available_numbers = list(self.numbers)
-
-        # Если есть история цветов, проверяем ограничение
-        if len(self.last_colors) >= self.max_same_color_streak:
-            last_color = self.last_colors[-1]
-            streak_count = 1
-
-            # Считаем сколько раз подряд последний цвет выпадал
-            for color in reversed(self.last_colors[:-1]):
-                if color == last_color:
-                    streak_count += 1
-                else:
-                    break
-
-            # Если достигли лимита, исключаем числа этого цвета
-            if streak_count >= self.max_same_color_streak:
-                if last_color == "красное":
-                    available_numbers = [n for n in available_numbers if n not in CONFIG.RED_NUMBERS]
-                elif last_color == "черное":
-                    available_numbers = [n for n in available_numbers if n not in CONFIG.BLACK_NUMBERS]
-                elif last_color == "зеленое":
-                    available_numbers = [n for n in available_numbers if n != 0]
-
-        # Проверяем, что остались доступные числа
-        if not available_numbers:
-            # Если все числа исключены, используем все исходные числа
-            available_numbers = list(self.numbers)
+        # Если достигли лимита серии, исключаем числа этого цвета (пулы готовы заранее)
+        if self._current_streak >= self.max_same_color_streak:
+            available_numbers = self._pools[self._current_color]
+        else:
+            available_numbers = self.numbers
 
         # Выбираем случайное число из доступных
-        result = self._rng.choice(available_numbers)
+        result = available_numbers[self._next_index(len(available_numbers))]
 
-        # Обновляем историю цветов
-        result_color = self.get_color(result)
-        self.last_colors.append(result_color)
-
-        # Держим только последние N цветов для оптимизации
-        if len(self.last_colors) > 10:
-            self.last_colors = self.last_colors[-10:]
+        # Обновляем серию цветов
+        result_color = self._color_ids[result]
+        if result_color == self._current_color:
+            self._current_streak += 1
+        else:
+            self._current_color = result_color
+            self._current_streak = 1
 
         return result
 
+    def spin_batch(self, k: int) -> List[int]:
+        """Серия из k вращений подряд (для симуляций и нагрузочных проверок).
+
+        Буфер случайных байтов пополняется одним вызовом под всю серию.
+        """
+        need = k - (len(self._rand_pool) - self._rand_idx)
+        if need > 0:
+            self._rand_pool = self._rand_pool[self._rand_idx:] + self._rng.randbytes(need + 1024)
+            self._rand_idx = 0
+        spin = self.spin
+        return [spin() for _ in range(k)]
+
+    def _next_index(self, n: int) -> int:
+        """Равномерный индекс в [0, n) из буфера байтов: умножение и старший байт вместо %.
+
+        Байты, дающие смещение (младший байт произведения < 256 % n), отбрасываются.
+        """
+        threshold = 256 % n
+        while True:
+            if self._rand_idx >= len(self._rand_pool):
+                self._rand_pool = self._rng.randbytes(1024)
+                self._rand_idx = 0
+            m = self._rand_pool[self._rand_idx] * n
+            self._rand_idx += 1
+            if (m & 0xFF) >= threshold:
+                return m >> 8
+
     def get_color(self, number: int) -> str:
-        if number == 0:
-            return "зеленое"
-        return "красное" if number in CONFIG.RED_NUMBERS else "черное"
+        return self._color_table[number]
 
     def get_color_emoji(self, number: int) -> str:
-        if number == 0:
-            return "🟢"
-        return "🔴" if number in CONFIG.RED_NUMBERS else "⚫"
+        return self._emoji_table[number]
+
+    def _build_bet_table(self) -> Dict[Tuple[str, Any], Tuple[int, int]]:
+        """(тип, значение) -> (маска выигрышных чисел, множитель); считается один раз"""
+        payouts = CONFIG.PAYOUTS
+        table = {}
+        for n in self.numbers:
+            table[("число", n)] = table[("число", str(n))] = (1 << n, payouts["число"])
+        table[("цвет", "красное")] = (RED_MASK, _COLOR_MULTIPLIERS["красное"])
+        table[("цвет", "черное")] = (BLACK_MASK, _COLOR_MULTIPLIERS["черное"])
+        table[("цвет", "зеленое")] = (1, _COLOR_MULTIPLIERS["зеленое"])
+        for group, idx in self._std_group_idx.items():
+            # Стандартные группы записаны диапазоном, поэтому множитель как у диапазона
+            table[("группа", group)] = (_mask(range(3 * idx + 1, 3 * idx + 4)), _RANGE_MULTIPLIERS[3])
+        return table
+
+    def bet_entry(self, bet_type: str, bet_value: Any) -> Tuple[int, int]:
+        """(маска выигрышных чисел, множитель) ставки: выигрыш — бит result в маске"""
+        entry = self._bets.get((bet_type, bet_value))
+        if entry is None:
+            entry = _parse_bet(bet_type, bet_value)
+        return entry
 
     def check_bet(self, bet_type: str, bet_value: Any, result: int) -> bool:
-        try:
-            if bet_type == "число":
-                num_value = int(bet_value) if isinstance(bet_value, str) else bet_value
-                return num_value == result
-            elif bet_type == "цвет":
-                return (
-                        (bet_value == "красное" and result in CONFIG.RED_NUMBERS) or
-                        (bet_value == "черное" and result in CONFIG.BLACK_NUMBERS) or
-                        (bet_value == "зеленое" and result == 0)
-                )
-            elif bet_type == "группа":
-                if bet_value in self.standard_groups:
-                    return result in self.standard_groups[bet_value]
-                if isinstance(bet_value, str) and '-' in bet_value:
-                    try:
-                        start, end = map(int, bet_value.split('-'))
-                        if 0 <= start <= 12 and 0 <= end <= 12 and start < end:
-                            return start <= result <= end
-                    except (ValueError, TypeError):
-                        return False
-            return False
-        except (ValueError, TypeError):
-            return False
-
-    def get_multiplier(self, bet_type: str, bet_value: Any) -> Decimal:
-        if bet_type == "число":
-            return CONFIG.PAYOUTS["число"]
-        elif bet_type == "цвет":
-            color_key = f"цвет_{bet_value}"
-            return CONFIG.PAYOUTS.get(color_key, Decimal('1.0'))
-        elif bet_type == "группа":
-            if isinstance(bet_value, str) and '-' in bet_value:
-                try:
-                    start, end = map(int, bet_value.split('-'))
-                    if 0 <= start <= 12 and 0 <= end <= 12 and start < end:
-                        count = end - start + 1
-                        return (CONFIG.PAYOUTS["число"] / Decimal(count)).quantize(
-                            Decimal('0.001'), rounding=ROUND_DOWN
-                        )
-                except (ValueError, TypeError):
-                    pass
-            return CONFIG.PAYOUTS["группа_стандарт"]
-        return Decimal('1.0')
+        if bet_type == "группа":
+            idx = self._std_group_idx.get(bet_value)
+            if idx is not None:
+                return 1 <= result <= 12 and (result - 1) // 3 == idx
+        return (self.bet_entry(bet_type, bet_value)[0] >> result) & 1 == 1
+
+    def get_multiplier(self, bet_type: str, bet_value: Any) -> int:
+        return self.bet_entry(bet_type, bet_value)[1]
 
     def get_color_streak_info(self) -> str:
         """Возвращает информацию о текущей серии цветов"""
-        if not self.last_colors:
+        if self._current_color is None:
             return "История цветов пуста"
-
-        current_color = self.last_colors[-1]
-        streak_count = 1
-
-        for color in reversed(self.last_colors[:-1]):
-            if color == current_color:
-                streak_count += 1
-            else:
-                break
-
-        return f"Текущая серия: {current_color} ({streak_count} раз подряд)"
+        return self._STREAK_FMT(_COLOR_NAMES[self._current_color], self._current_streak)
 
 
 class RouletteKeyboard:
     @staticmethod
-    def create_roulette_keyboard() -> InlineKeyboardMarkup:
+    def _build() -> InlineKeyboardMarkup:
         return InlineKeyboardMarkup(row_width=4).row(
             InlineKeyboardButton("1-3", callback_data="bet:1-3"),
             InlineKeyboardButton("4-6", callback_data="bet:4-6"),
@@ -154,43 +225,99 @@ class RouletteKeyboard:
             InlineKeyboardButton("Крутить", callback_data="action:spin"),
         )
 
+    @staticmethod
+    def create_roulette_keyboard() -> InlineKeyboardMarkup:
+        return _ROULETTE_KB
+
+
+# Клавиатура рулетки статична: собираем её один раз при импорте
+_ROULETTE_KB = RouletteKeyboard._build()
+
+
+class _SpinEntry:
+    """Состояние антифлуда одного пользователя в одном чате"""
+    __slots__ = ('last', 'count', 'reset')
+
+    def __init__(self, reset: float):
+        self.last = float('-inf')  # время последнего прокрута
+        self.count = 0             # прокрутов за текущее окно
+        self.reset = reset         # начало окна
+
 
 class AntiFloodManager:
-    __slots__ = ('user_last_spin', 'user_spin_count', 'user_spin_reset_time')
+    __slots__ = ('state', 'min_interval', 'max_spins', 'reset_interval', 'cleanup_interval', '_last_cleanup',
+                 '_cleanup_task', '_expiry_heap')
+
+    # Очистка не чаще раза в секунду
+    CLEANUP_MIN_INTERVAL = 1.0
+    # Фоновая очистка: часто под нагрузкой, редко когда записей мало
+    CLEANUP_BUSY_ENTRIES = 1024
 
     def __init__(self):
-        self.user_last_spin: Dict[Tuple[int, int], float] = {}
-        self.user_spin_count: Dict[Tuple[int, int], int] = {}
-        self.user_spin_reset_time: Dict[Tuple[int, int], float] = {}
+        self.state: Dict[Tuple[int, int], _SpinEntry] = {}
+        # Лимиты читаются из CONFIG один раз, а не на каждый прокрут
+        self.min_interval = CONFIG.MIN_SPIN_INTERVAL
+        self.max_spins = CONFIG.MAX_SPINS_PER_MINUTE
+        self.reset_interval = CONFIG.RESET_INTERVAL
+        self.cleanup_interval = CONFIG.CLEANUP_INTERVAL
+        self._last_cleanup = float('-inf')
+        self._cleanup_task: Optional[asyncio.Task] = None
+        # Куча (время истечения, ключ): очистка снимает только истёкшие записи, без обхода словаря
+        self._expiry_heap: List[Tuple[float, Tuple[int, int]]] = []
+
+    def start_cleanup_task(self, busy_interval: float = 30.0, idle_interval: float = 300.0):
+        """Запускает фоновую очистку: can_spin сам никогда не чистит словарь"""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop(busy_interval, idle_interval))
+
+    def stop_cleanup_task(self):
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+
+    async def _cleanup_loop(self, busy_interval: float, idle_interval: float):
+        while True:
+            # Интервал выбирается по числу ожидающих истечения меток в куче
+            busy = len(self._expiry_heap) >= self.CLEANUP_BUSY_ENTRIES
+            await asyncio.sleep(busy_interval if busy else idle_interval)
+            self.cleanup_old_entries()
 
     def can_spin(self, user_id: int, chat_id: int) -> Tuple[bool, float]:
         key = (user_id, chat_id)
-        current_time = asyncio.get_event_loop().time()
-        if key in self.user_last_spin:
-            last_spin_time = self.user_last_spin[key]
-            elapsed = current_time - last_spin_time
-            if elapsed < CONFIG.MIN_SPIN_INTERVAL:
-                return False, CONFIG.MIN_SPIN_INTERVAL - elapsed
-        if key not in self.user_spin_count:
-            self.user_spin_count[key] = 0
-            self.user_spin_reset_time[key] = current_time
-        if current_time - self.user_spin_reset_time[key] > CONFIG.RESET_INTERVAL:
-            self.user_spin_count[key] = 0
-            self.user_spin_reset_time[key] = current_time
-        if self.user_spin_count[key] >= CONFIG.MAX_SPINS_PER_MINUTE:
-            time_until_reset = CONFIG.RESET_INTERVAL - (current_time - self.user_spin_reset_time[key])
-            return False, time_until_reset
-        self.user_last_spin[key] = current_time
-        self.user_spin_count[key] += 1
+        current_time = time.monotonic()
+        entry = self.state.get(key)
+        if entry is None:
+            # Первый прокрут всегда разрешён: запись создаётся уже с ним
+            entry = self.state[key] = _SpinEntry(current_time)
+            entry.last = current_time
+            entry.count = 1
+            heapq.heappush(self._expiry_heap, (current_time + self.cleanup_interval, key))
+            return True, 0
+        # Отказы ничего не записывают — под флудом это основной путь
+        elapsed = current_time - entry.last
+        if elapsed < self.min_interval:
+            return False, self.min_interval - elapsed
+        since_reset = current_time - entry.reset
+        if since_reset > self.reset_interval:
+            entry.count = 1
+            entry.reset = current_time
+        elif entry.count >= self.max_spins:
+            return False, self.reset_interval - since_reset
+        else:
+            entry.count += 1
+        entry.last = current_time
+        heapq.heappush(self._expiry_heap, (current_time + self.cleanup_interval, key))
         return True, 0
 
     def cleanup_old_entries(self):
-        current_time = asyncio.get_event_loop().time()
-        old_keys = [
-            key for key, timestamp in self.user_last_spin.items()
-            if current_time - timestamp > CONFIG.CLEANUP_INTERVAL
-        ]
-        for key in old_keys:
-            self.user_last_spin.pop(key, None)
-            self.user_spin_count.pop(key, None)
-            self.user_spin_reset_time.pop(key, None)
\ No newline at end of file
+        current_time = time.monotonic()
+        if current_time - self._last_cleanup < self.CLEANUP_MIN_INTERVAL:
+            return
+        self._last_cleanup = current_time
+        heap = self._expiry_heap
+        while heap and heap[0][0] < current_time:
+            _, key = heapq.heappop(heap)
+            entry = self.state.get(key)
+            # Более поздний прокрут оставил в куче новую метку — такую запись не трогаем
+            if entry is not None and current_time - entry.last > self.cleanup_interval:
+                del self.state[key]
@@ -5,18 +5,18 @@ from datetime import datetime
 from typing import List, Dict, Tuple, Optional, Any
 from aiogram import types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.utils.exceptions import BadRequest
 
 from config import bot
 from database import get_db
-from database.crud import UserRepository, RouletteRepository
+from database.crud import UserRepository
+from handlers.record import schedule_refresh_top
 from handlers.roulette_limit import roulette_limit_manager
-from handlers.roulette_logs import RouletteLogger
+from handlers.roulette_logs import roulette_logger
 from main import logger
 
 # Локальные импорты из модульной структуры
 from .config import CONFIG
-from .models import Bet, UserBetSession, ChatSession, SessionManager
+from .models import Bet, BET_POOL, UserBetSession, ChatSession, SessionManager
 from .validators import BetValidator, BetParser, DatabaseManager, UserFormatter
 from .game_logic import RouletteGame, RouletteKeyboard, AntiFloodManager
 from .utils import (
@@ -32,60 +32,63 @@ from .utils import (
 )
 
 
+# Предпроверка ставки: \d — тот же класс символов, что и в шаблоне суммы BetParser
+_DIGIT_RE = re.compile(r"\d")
+
+# Данные кнопок ставок -> (тип, значение)
+_BET_CALLBACK_TYPES = {
+    "1-3": ("группа", "1-3"),
+    "4-6": ("группа", "4-6"),
+    "7-9": ("группа", "7-9"),
+    "10-12": ("группа", "10-12"),
+}
+_QUICK_BET_COLORS = {
+    "red": ("цвет", "красное"),
+    "black": ("цвет", "черное"),
+    "green": ("цвет", "зеленое"),
+}
+
 
 class RouletteHandler:
     """Основной обработчик рулетки"""
+    # Очистка сессий чатов: раз в 30 сек при большом числе чатов, иначе раз в 5 минут
+    CLEANUP_BUSY_SESSIONS = 500
+    CLEANUP_BUSY_INTERVAL = 30
+    CLEANUP_IDLE_INTERVAL = 300
+
     def __init__(self):
         self.game = RouletteGame()
         self.session_manager = SessionManager()
-        self.logger = RouletteLogger()
+        self.logger = roulette_logger
         self.anti_flood = AntiFloodManager()
         self._cleanup_task = None
-        self._command_handlers = self._setup_command_handlers()
+        self._log_flush_task = None
 
     async def initialize(self):
         """Инициализация обработчика"""
+        self.anti_flood.start_cleanup_task()
         self._cleanup_task = asyncio.create_task(self._periodic_cleanup())
+        self._log_flush_task = asyncio.create_task(self.logger.run_flush_loop())
 
     async def shutdown(self):
         """Остановка обработчика"""
-        if self._cleanup_task:
-            self._cleanup_task.cancel()
-            try:
-                await self._cleanup_task
-            except asyncio.CancelledError:
-                pass
+        self.anti_flood.stop_cleanup_task()
+        for task in (self._cleanup_task, self._log_flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.logger.flush()
 
     async def _periodic_cleanup(self):
         """Периодическая очистка старых записей"""
         while True:
-            await asyncio.sleep(60)
-            self.anti_flood.cleanup_old_entries()
+            busy = len(self.session_manager.sessions) >= self.CLEANUP_BUSY_SESSIONS
+            await asyncio.sleep(self.CLEANUP_BUSY_INTERVAL if busy else self.CLEANUP_IDLE_INTERVAL)
             self.session_manager.cleanup_old_sessions()
 
-    def _setup_command_handlers(self) -> Dict[str, callable]:
-        """Настраивает обработчики текстовых команд"""
-        return {
-            "го": self.spin_roulette,
-            "крутить": self.spin_roulette,
-            "spin": self.spin_roulette,
-            "отмена": self.clear_bets_command,
-            "очистить": self.clear_bets_command,
-            "clear": self.clear_bets_command,
-            "ставки": self.show_my_bets,
-            "мои ставки": self.show_my_bets,
-            "bets": self.show_my_bets,
-            "лог": lambda m: self.show_logs_command(m, False),
-            "!лог": lambda m: self.show_logs_command(m, True),
-            "повторить": lambda m: self._repeat_last_bets(m.from_user.id, m.chat.id, m),
-            "repeat": lambda m: self._repeat_last_bets(m.from_user.id, m.chat.id, m),
-            "удвоить": lambda m: self._double_bets(m.from_user.id, m.chat.id, m),
-            "удвой": lambda m: self._double_bets(m.from_user.id, m.chat.id, m),
-            "double": lambda m: self._double_bets(m.from_user.id, m.chat.id, m),
-            "лимит рулетки": self.show_limits,
-            "limit roulette": self.show_limits,
-        }
-
     # -------------------------------------------------------------------------
     # ОСНОВНЫЕ КОМАНДЫ
     # -------------------------------------------------------------------------
@@ -115,8 +118,9 @@ class RouletteHandler:
         user_id = message.from_user.id
         chat_id = message.chat.id
         session = self.session_manager.get_session(chat_id)
-        user_session = session.get_user_session(user_id, get_display_name(message.from_user))
-        if user_session.has_bets:
+        # Только проверка ставок в памяти: пустую сессию игрока не создаём
+        user_session = session.user_sessions.get(user_id)
+        if user_session and user_session.has_bets:
             await self.spin_roulette(message)
 
     async def clear_bets_command(self, message: types.Message):
@@ -131,10 +135,10 @@ class RouletteHandler:
         user_id = message.from_user.id
         chat_id = message.chat.id
         session = self.session_manager.get_session(chat_id)
-        if user_id not in session.user_sessions or not session.user_sessions[user_id].has_bets:
+        user_session = session.user_sessions.get(user_id)
+        if not (user_session and user_session.has_bets):
             await message.answer("❌ У вас нет активных ставок")
             return
-        user_session = session.user_sessions[user_id]
         await message.answer(
             f"📋 Ваши активные ставки:\n{user_session.get_bets_info()}",
             parse_mode="Markdown"
@@ -145,16 +149,15 @@ class RouletteHandler:
         user_id = message.from_user.id
         chat_id = message.chat.id
         async with DatabaseManager.db_session() as db:
-            user = UserRepository.get_user_by_telegram_id(db, user_id)
-            if not user:
+            coins = UserRepository.get_coins(db, user_id)
+            if coins is None:
                 await message.answer("❌ Сначала зарегистрируйтесь через /start в ЛС с ботом!")
                 return
-            coins = user.coins
             display_name = get_plain_username(get_display_name(message.from_user))
             session = self.session_manager.get_session(chat_id)
             active_bets_amount = 0
-            if user_id in session.user_sessions and session.user_sessions[user_id].has_bets:
-                active_bets_amount = session.user_sessions[user_id].total_amount
+            if (user_session := session.user_sessions.get(user_id)) and user_session.has_bets:
+                active_bets_amount = user_session.total_amount
             balance_text = f"{display_name} \nмонеты: {coins}🪙"
             if active_bets_amount > 0:
                 balance_text += f" +{active_bets_amount}"
@@ -168,20 +171,34 @@ class RouletteHandler:
             await message.answer("📊 Логи рулетки этого чата:\nПока нет записей о играх")
             return
         limit = CONFIG.MAX_GAME_LOGS if show_all else 10
-        logs = self.logger.get_recent_logs(chat_id, limit)
-        if not logs:
+        lines = self.logger.get_recent_lines(chat_id, limit)
+        if not lines:
             await message.answer("📊 Логи рулетки этого чата:\nПока нет записей о играх")
             return
-        logs_text = "".join(f"{log['color_emoji']}{log['result']}\n" for log in logs)
-        await message.answer(logs_text)
+        lines.append("")
+        await message.answer("\n".join(lines))
+
+    async def show_all_logs_command(self, message: types.Message):
+        """Команда показа всех сохранённых логов"""
+        await self.show_logs_command(message, True)
+
+    async def repeat_bets_command(self, message: types.Message):
+        """Команда повторения последних ставок"""
+        await self._repeat_last_bets(message.from_user.id, message.chat.id, message)
+
+    async def double_bets_command(self, message: types.Message):
+        """Команда удвоения текущих ставок"""
+        await self._double_bets(message.from_user.id, message.chat.id, message)
 
     async def show_limits(self, message: types.Message):
         """Показывает информацию о лимитах рулетки"""
         user_id = message.from_user.id
         chat_id = message.chat.id
-        limit_info = roulette_limit_manager.get_spin_info_for_chat(user_id, chat_id)
+        # Состояние лимита читается один раз и используется и для текста, и для кнопки
+        limit_state = roulette_limit_manager.get_limit_state(user_id, chat_id)
+        limit_info = roulette_limit_manager.get_spin_info_for_chat(user_id, chat_id, limit_state)
         # Проверяем статус лимита
-        if not roulette_limit_manager.has_roulette_limit_removed_in_chat(user_id, chat_id):
+        if not limit_state.has_unlimited:
             keyboard = InlineKeyboardMarkup().add(
                 InlineKeyboardButton("🛍️ Купить снятие лимита", callback_data="back_to_shop")
             )
@@ -208,25 +225,27 @@ class RouletteHandler:
             user_session = session.get_user_session(user_id, username)
             successful_bets = []
             total_amount = 0
+            max_amount = 0
             errors = []
             for amount, bet_type, bet_value in bets:
                 is_valid, error_msg = BetValidator.validate_bet(amount, coins, user_session.total_amount)
                 if not is_valid:
                     errors.append(error_msg)
                     continue
-                bet = Bet(amount, bet_type, bet_value, username, user_id)
+                bet = BET_POOL.acquire(amount, bet_type, bet_value, username, user_id)
                 if user_session.add_bet(bet):
                     coins -= amount
                     total_amount += amount
                     successful_bets.append(bet)
-                    UserRepository.update_user_balance(db, user_id, coins)
-                    UserRepository.update_max_bet(db, user_id, amount)
+                    max_amount = max(max_amount, amount)
 
             if not successful_bets:
                 error_message = "\n".join(errors) if errors else "❌ Не удалось разместить ни одну ставку"
                 return False, error_message, 0
+            # Баланс и максимальная ставка записываются один раз за сообщение
+            UserRepository.apply_bets(db, user_id, coins, max_amount)
 
-            if not getattr(session, 'is_doubling_operation', False):
+            if not session.is_doubling_operation:
                 session.last_user_bets[user_id] = bets
             session.is_doubling_operation = False
 
@@ -244,22 +263,27 @@ class RouletteHandler:
                                 user_link: str, errors: List[str]) -> str:
         """Форматирует сообщение об успешной ставке"""
         if len(successful_bets) == 1:
-            bet = successful_bets[0]
-            text = f"Ставка принята: {user_link} {total_amount} монет на {bet.value}"
+            text = f"Ставка принята: {user_link} {total_amount} монет на {successful_bets[0].value}"
+            # Самый частый случай — одна ставка без ошибок: готовая строка без списков
+            if not errors:
+                return text
+            parts = [text]
         else:
-            bet_details = [f" ᅠ{bet.amount} на {bet.value}" for bet in successful_bets]
-            text = f"Ставки приняты:\n" + "\n".join(bet_details) + f"\n💰 Общая сумма: {total_amount}"
+            parts = ["Ставки приняты:"]
+            parts.extend(f" ᅠ{bet.amount} на {bet.value}" for bet in successful_bets)
+            parts.append(f"💰 Общая сумма: {total_amount}")
         if errors:
-            text += f"\nОшибки:\n" + "\n".join(errors)
-        return text
+            parts.append("Ошибки:")
+            parts.extend(errors)
+        return "\n".join(parts)
 
     async def _clear_bets(self, user_id: int, chat_id: int, message: types.Message) -> Tuple[bool, str]:
         """Очищает все ставки пользователя"""
         session = self.session_manager.get_session(chat_id)
-        if user_id not in session.user_sessions or not session.user_sessions[user_id].has_bets:
+        user_session = session.user_sessions.get(user_id)
+        if not (user_session and user_session.has_bets):
             return False, "❌ У вас нет активных ставок для очистки"
 
-        user_session = session.user_sessions[user_id]
         total_amount = user_session.clear_bets()
 
         async with DatabaseManager.db_session() as db:
@@ -280,15 +304,21 @@ class RouletteHandler:
         chat_id = message.chat.id
         username = get_display_name(message.from_user)
 
-        if await self._handle_special_commands(text, message, user_id, chat_id, username):
+        # Ставки начинаются с цифры — для них поиск команды не нужен
+        if not text[:1].isdigit() and await self._handle_special_commands(text, message, user_id, chat_id,
+                                                                          username):
             return
 
         if text.upper() == "Б" or text.startswith("/"):
             return
 
         session = self.session_manager.get_session(chat_id)
-        if user_id in session.waiting_for_bet:
-            await self._handle_waiting_bet(user_id, chat_id, text, username, message, session)
+        if (waiting := session.waiting_for_bet.get(user_id)) is not None:
+            await self._handle_waiting_bet(user_id, chat_id, text, username, message, session, waiting)
+            return
+
+        # В любой ставке есть сумма, а значит цифра: обычные сообщения чата в парсеры не идут
+        if not _DIGIT_RE.search(text):
             return
 
         bets = BetParser.parse_multiple_bets(text)
@@ -309,11 +339,10 @@ class RouletteHandler:
     async def _handle_special_commands(self, text: str, message: types.Message,
                                        user_id: int, chat_id: int, username: str) -> bool:
         """Обрабатывает специальные команды"""
-        text_lower = text.lower().strip()
-        if text_lower in ['лимиты', 'лимит', 'limits']:
-            from handlers.transfer_limit import transfer_limit
-            limit_info = transfer_limit.get_limit_info(user_id)
-            await message.answer(limit_info)
+        text_lower = text.lower()
+        handler = self._COMMAND_HANDLERS.get(text_lower)
+        if handler is not None:
+            await handler(self, message)
             return True
 
         if text_lower.startswith(("ва-банк", "вабанк", "ва банк")):
@@ -322,16 +351,18 @@ class RouletteHandler:
                 await message.answer("❌ Укажите тип ставки для вабанка\nПример: вабанк красное")
                 return True
             bet_type = parts[1]
-            await self._handle_vabank(user_id, chat_id, bet_type, message)
-            return True
-
-        if text_lower in self._command_handlers:
-            await self._command_handlers[text_lower](message)
+            await self._handle_vabank(user_id, chat_id, bet_type, message, username)
             return True
 
         return False
 
-    async def _handle_vabank(self, user_id: int, chat_id: int, bet_value: str, message: types.Message):
+    async def _show_transfer_limits(self, message: types.Message):
+        """Показывает лимиты переводов"""
+        from handlers.transfer_limit import transfer_limit
+        await message.answer(transfer_limit.get_limit_info(message.from_user.id))
+
+    async def _handle_vabank(self, user_id: int, chat_id: int, bet_value: str, message: types.Message,
+                             username: str):
         """Обработка ва-банк"""
         async with DatabaseManager.db_session() as db:
             user = UserRepository.get_user_by_telegram_id(db, user_id)
@@ -340,7 +371,6 @@ class RouletteHandler:
                 return
 
             session = self.session_manager.get_session(chat_id)
-            username = get_display_name(message.from_user)
             user_session = session.get_user_session(user_id, username)
             current_balance = user.coins
 
@@ -357,14 +387,13 @@ class RouletteHandler:
                 return
 
             bet_type, full_bet_value = bet_data
-            vabank_bet = Bet(current_balance, bet_type, full_bet_value, username, user_id)
+            vabank_bet = BET_POOL.acquire(current_balance, bet_type, full_bet_value, username, user_id)
             if not user_session.add_bet(vabank_bet):
                 await message.answer("❌ Не удалось разместить ва-банк ставку")
                 return
 
-            UserRepository.update_user_balance(db, user_id, 0)
-            total_all_bets = user_session.total_amount
-            UserRepository.update_max_bet(db, user_id, max(getattr(user, 'max_bet', 0), total_all_bets))
+            # Обнуление баланса и максимальная ставка — одна запись, как и у обычных ставок
+            UserRepository.apply_bets(db, user_id, 0, user_session.total_amount)
 
             user_link = format_username_with_link(user_id, username)
             vabank_text = f"🎲 ВА-БАНК! {user_link} поставил все {current_balance:,} монет на {full_bet_value}"
@@ -375,9 +404,9 @@ class RouletteHandler:
                 logger.error(f"Ошибка при создании сообщения: {e}")
 
     async def _handle_waiting_bet(self, user_id: int, chat_id: int, text: str, username: str,
-                                  message: types.Message, session: ChatSession):
+                                  message: types.Message, session: ChatSession, waiting: Tuple[str, str]):
         """Обработка ожидаемой ставки"""
-        bet_type, bet_value = session.waiting_for_bet[user_id]
+        bet_type, bet_value = waiting
         amount = BetParser.parse_amount(text.split()[0])
         if amount is None:
             await message.answer("❌ Введите корректную сумму (пример: 1000 или 1k)")
@@ -451,15 +480,9 @@ class RouletteHandler:
     async def _handle_bet_callback(self, call: types.CallbackQuery, user_id: int,
                                    chat_id: int, callback_data: str):
         """Обработка callback-ов ставок"""
-        bet_type_mapping = {
-            "1-3": ("группа", "1-3"),
-            "4-6": ("группа", "4-6"),
-            "7-9": ("группа", "7-9"),
-            "10-12": ("группа", "10-12"),
-        }
-        if callback_data in bet_type_mapping:
+        if (mapped := _BET_CALLBACK_TYPES.get(callback_data)) is not None:
             session = self.session_manager.get_session(chat_id)
-            bet_type, bet_value = bet_type_mapping[callback_data]
+            bet_type, bet_value = mapped
             session.waiting_for_bet[user_id] = (bet_type, bet_value)
             await call.answer(f"Выбрано: {bet_value}. Введите сумму ставки")
         else:
@@ -469,15 +492,10 @@ class RouletteHandler:
                                          chat_id: int, callback_data: str):
         """Обработка callback-ов быстрых ставок"""
         try:
-            amount_str, color_type = callback_data.split("_")
+            amount_str, _, color_type = callback_data.partition("_")
             amount = int(amount_str)
-            color_map = {
-                "red": ("цвет", "красное"),
-                "black": ("цвет", "черное"),
-                "green": ("цвет", "зеленое")
-            }
-            if color_type in color_map:
-                bet_type, bet_value = color_map[color_type]
+            if (mapped := _QUICK_BET_COLORS.get(color_type)) is not None:
+                bet_type, bet_value = mapped
                 username = get_display_name(call.from_user)
                 ok, result_msg, total = await self._place_multiple_bets(
                     user_id, chat_id, [(amount, bet_type, bet_value)], username, call.message
@@ -498,7 +516,7 @@ class RouletteHandler:
         username = get_display_name(call.from_user)
         session = self.session_manager.get_session(chat_id)
         if callback_data == "spin":
-            if session.is_spinning:
+            if session.spin_lock.locked():
                 await call.answer("🎰 Рулетка уже крутится! Подождите...")
                 return
             await self.spin_roulette(call.message)
@@ -534,110 +552,113 @@ class RouletteHandler:
         chat_id = message.chat.id
         session = self.session_manager.get_session(chat_id)
 
-        try:
-            await asyncio.wait_for(asyncio.sleep(0), timeout=1.0)
-            await session.spin_lock.acquire()
-        except asyncio.TimeoutError:
+        # Занятый лок и есть признак идущей игры: второй прокрут сразу получает отказ
+        if session.spin_lock.locked():
             await message.answer("🎰 Рулетка уже крутится! Подождите завершения текущей игры.")
             return
 
-        try:
-            if session.is_spinning:
-                await message.answer("🎰 Рулетка уже крутится! Подождите завершения текущей игры.")
-                return
-
-            session.is_spinning = True
-
-            can_spin, wait_time = self.anti_flood.can_spin(user_id, chat_id)
-            if not can_spin:
-                time_text = format_wait_time(wait_time)
-                await message.answer(f"⏳ Слишком часто! Подождите {time_text} перед следующим запуском.")
-                return
-
-            if not await self.check_spin_limit(user_id, chat_id, message):
-                return
-
-            active_users = session.active_users
-            if not active_users:
-                await message.answer("❌ Нет активных ставок для игры!")
-                return
-
-            if not roulette_limit_manager.record_spin_in_chat(user_id, chat_id):
-                await message.answer("❌ Лимит прокрутов в этом чате исчерпан!")
-                return
-
-            spin_msg = await message.answer(f"🎰 Крутим рулетку (через {CONFIG.SPIN_DELAY} сек.)")
-            session.spin_message_id = spin_msg.message_id
-            await asyncio.sleep(CONFIG.SPIN_DELAY)
-
-            result = self.game.spin()
-            color_emoji = self.game.get_color_emoji(result)
-            self.logger.add_game_log(chat_id, result, color_emoji)
-
-            await delete_spin_message(chat_id, session.spin_message_id)
-            session.spin_message_id = None
-
-            result_text = await self._process_game_results(active_users, result, color_emoji, chat_id, session)
+        async with session.spin_lock:
             try:
-                await message.answer(result_text, parse_mode="Markdown")
-            except BadRequest as e:
-                if "Message to be replied not found" in str(e):
+                can_spin, wait_time = self.anti_flood.can_spin(user_id, chat_id)
+                if not can_spin:
+                    time_text = format_wait_time(wait_time)
+                    await message.answer(f"⏳ Слишком часто! Подождите {time_text} перед следующим запуском.")
+                    return
+
+                if not await self.check_spin_limit(user_id, chat_id, message):
+                    return
+
+                active_users = session.active_users
+                if not active_users:
+                    await message.answer("❌ Нет активных ставок для игры!")
+                    return
+
+                if not roulette_limit_manager.record_spin_in_chat(user_id, chat_id):
+                    await message.answer("❌ Лимит прокрутов в этом чате исчерпан!")
+                    return
+
+                spin_msg = await message.answer(f"🎰 Крутим рулетку (через {CONFIG.SPIN_DELAY} сек.)")
+                session.spin_message_id = spin_msg.message_id
+                await asyncio.sleep(CONFIG.SPIN_DELAY)
+
+                result = self.game.spin()
+                color_emoji = self.game.get_color_emoji(result)
+                self.logger.add_game_log(chat_id, result, color_emoji)
+
+                await delete_spin_message(chat_id, session.spin_message_id)
+                session.spin_message_id = None
+
+                result_text = await self._process_game_results(active_users, result, color_emoji, chat_id, session)
+                # answer() шлёт обычное сообщение в чат, не ответ — исчезнувший исходник ему не мешает
+                try:
                     await message.answer(result_text, parse_mode="Markdown")
-                else:
-                    try:
-                        await message.answer(result_text, parse_mode="Markdown")
-                    except Exception:
-                        logger.error(f"Failed to send roulette result: {e}")
+                except Exception as e:
+                    logger.error(f"Failed to send roulette result: {e}")
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка при кручении рулетки: {e}")
-            await message.answer("❌ Произошла ошибка при кручении рулетки")
-        finally:
-            session.is_spinning = False
-            if session.spin_lock.locked():
-                session.spin_lock.release()
+            except Exception as e:
+                logger.error(f"❌ Ошибка при кручении рулетки: {e}")
+                await message.answer("❌ Произошла ошибка при кручении рулетки")
 
     async def _process_game_results(self, active_users: Dict[int, UserBetSession], result: int,
                                     color_emoji: str, chat_id: int, session: ChatSession) -> str:
         """Обрабатывает результаты игры для всех пользователей"""
-        result_text = f"🎰 Рулетка: {result}{color_emoji}\n"
         user_updates = {}
         user_stats_updates = {}
+        transactions_data = []
 
-        # Сохраняем ставки для повторения
-        for user_id, user_session in active_users.items():
-            if user_session.bets:
-                bets_for_repeat = [(bet.amount, bet.type, bet.value) for bet in user_session.bets]
-                session.last_user_bets[user_id] = bets_for_repeat
-
-        # Обрабатываем каждого пользователя
-        for user_id, user_session in active_users.items():
-            async with DatabaseManager.db_session() as db:
-                user = UserRepository.get_user_by_telegram_id(db, user_id)
-                if not user:
-                    continue
-                user_result_text = await self._process_user_results(
-                    user_id, user_session, result, user, user_updates, user_stats_updates, chat_id
+        # Снимок активных игроков: дальше словарь сессий не перечитывается
+        active_items = list(active_users.items())
+
+        # Вся запись результатов спина идёт в одной сессии: загрузка игроков, транзакции, балансы
+        async with DatabaseManager.db_session() as db:
+            users = UserRepository.get_users_by_telegram_ids(db, active_users)
+
+            # Один проход: сохраняем ставки для повторения и собираем игроков, найденных в БД
+            players = []
+            for user_id, user_session in active_items:
+                if user_session.bets:
+                    session.last_user_bets[user_id] = tuple([(bet.amount, bet.type, bet.value)
+                                                             for bet in user_session.bets])
+                user = users.get(user_id)
+                if user is not None:
+                    players.append((user_id, user_session, user))
+
+            # Расчёт не делает I/O: один синхронный проход копит обновления всех игроков
+            user_texts = [
+                self._process_user_results(
+                    user_id, user_session, result, user, user_updates, user_stats_updates, transactions_data, chat_id
                 )
-                result_text += user_result_text + "\n"
-                # Удаляем сообщения о ставках
-                await delete_bet_messages(chat_id, user_session.bet_message_ids)
+                for user_id, user_session, user in players
+            ]
+
+            # Балансы, статистика и транзакции всех игроков фиксируются одним коммитом
+            if user_updates:
+                try:
+                    await DatabaseManager.finalize_spin(db, user_updates, user_stats_updates, transactions_data)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при пакетном обновлении БД: {e}")
+
+        # Заголовок и блоки игроков, каждая часть заканчивается переводом строки
+        result_text = "\n".join([f"🎰 Рулетка: {result}{color_emoji}", *user_texts, ""])
+        # Сообщения о ставках всех игроков удаляются одним пакетом
+        await delete_bet_messages(
+            chat_id, [msg_id for _, user_session, _ in players for msg_id in user_session.bet_message_ids]
+        )
 
-        # Выполняем пакетное обновление БД
         if user_updates:
-            await self._update_database_batch(user_updates, user_stats_updates)
+            # Балансы изменились: пересобираем снимок топа чата в фоне
+            schedule_refresh_top(chat_id, list(user_updates))
 
         # Очищаем ставки всех активных пользователей
-        for user_id in active_users:
-            if user_id in session.user_sessions:
-                session.user_sessions[user_id].clear_bets()
+        for _, user_session in active_items:
+            user_session.clear_bets()
 
         return result_text
 
-    async def _process_user_results(self, user_id: int, user_session: UserBetSession, result: int,
-                                    user, user_updates: Dict, user_stats_updates: Dict,
-                                    chat_id: int) -> str:
-        """Обрабатывает результаты для одного пользователя"""
+    def _process_user_results(self, user_id: int, user_session: UserBetSession, result: int,
+                              user, user_updates: Dict, user_stats_updates: Dict,
+                              transactions_data: List[Dict], chat_id: int) -> str:
+        """Обрабатывает результаты для одного пользователя (без I/O, пишет в общие буферы спина)"""
         current_coins = user.coins
         win_coins = user.win_coins or 0
         defeat_coins = user.defeat_coins or 0
@@ -645,31 +666,25 @@ class RouletteHandler:
         min_win = user.min_win_coins or 0  # ← вместо None будет 0
         total_net_profit = 0
         total_payout = 0
-        user_bets_text = []
+        bets = user_session.bets
+        # Строки ставок заранее размечены по числу ставок — без роста списка
+        user_bets_text = [''] * len(bets)
         win_bets_text = []
         display_name = user_session.username
+        # Имя и ссылка экранируются один раз на игрока, а не на каждую ставку
+        plain_name = get_plain_username(display_name)
+        user_link = format_username_with_link(user_id, display_name)
 
-        # Сначала собираем все данные для транзакций
-        transactions_data = []
-        for bet in user_session.bets:
+        # Сначала собираем все данные для транзакций (общий список спина)
+        for i, bet in enumerate(bets):
             net_profit, payout = calculate_bet_result(self.game, bet, result)
             total_net_profit += net_profit
             total_payout += payout
-            plain_name = get_plain_username(display_name)
-            user_bets_text.append(f"{plain_name} {bet.amount} на {bet.value}")
+            user_bets_text[i] = f"{plain_name} {bet.amount} на {bet.value}"
             if net_profit > 0:
-                user_link = format_username_with_link(user_id, display_name)
                 win_bets_text.append(f"{user_link} выиграл {net_profit} на {bet.value}")
             # Сохраняем данные для транзакций
-            transactions_data.append({
-                'user_id': user_id,
-                'amount': bet.amount,
-                'is_win': net_profit > 0,
-                'bet_type': bet.type,
-                'bet_value': str(bet.value),
-                'result_number': result,
-                'profit': net_profit
-            })
+            transactions_data.append(bet.as_db_row(result, net_profit))
         logger.info(f"DEBUG: user_id={user_id}, profit={total_net_profit}, min_win={min_win}")
 
         # Обновляем min_win при ЛЮБОМ результате (даже при проигрыше!)
@@ -691,34 +706,8 @@ class RouletteHandler:
 
         user_stats_updates[user_id] = (win_coins, defeat_coins, max_win, min_win, new_max_bet)
 
-        # Создаем транзакции в отдельной операции
-        await self._create_roulette_transactions(transactions_data)
-
-
-
-        return "\n".join(user_bets_text + win_bets_text)
-
-    async def _create_roulette_transactions(self, transactions_data: List[Dict]):
-        """Создает транзакции рулетки в БД"""
-        async with DatabaseManager.db_session() as db:
-            for transaction in transactions_data:
-                RouletteRepository.create_roulette_transaction(
-                    db=db,
-                    user_id=transaction['user_id'],
-                    amount=transaction['amount'],
-                    is_win=transaction['is_win'],
-                    bet_type=transaction['bet_type'],
-                    bet_value=transaction['bet_value'],
-                    result_number=transaction['result_number'],
-                    profit=transaction['profit']
-                )
-
-    async def _update_database_batch(self, user_updates: Dict, user_stats_updates: Dict):
-        """Пакетное обновление БД"""
-        try:
-            await DatabaseManager.update_users_batch(user_updates, user_stats_updates)
-        except Exception as e:
-            logger.error(f"❌ Ошибка при пакетном обновлении БД: {e}")
+        user_bets_text.extend(win_bets_text)
+        return "\n".join(user_bets_text)
 
     # -------------------------------------------------------------------------
     # ПОВТОРИТЬ/УДВОИТЬ
@@ -726,50 +715,42 @@ class RouletteHandler:
     async def _repeat_last_bets(self, user_id: int, chat_id: int, message_or_call):
         """Повторяет последние ставки пользователя"""
         session = self.session_manager.get_session(chat_id)
-        username = get_display_name(
-            message_or_call.from_user if hasattr(message_or_call, 'from_user')
-            else message_or_call
-        )
-        if user_id not in session.last_user_bets or not session.last_user_bets[user_id]:
-            reply_method = getattr(message_or_call, 'answer', message_or_call.answer)
+        username = get_display_name(message_or_call.from_user)
+        last_bets = session.last_user_bets.get(user_id)
+        if not last_bets:
+            reply_method = message_or_call.answer
             await reply_method("❌ Нет последних ставок для повторения")
             return
 
-        last_bets = session.last_user_bets[user_id]
-        if hasattr(message_or_call, 'message'):
-            ok, result_msg, total = await self._place_multiple_bets(
-                user_id, chat_id, last_bets, username, message_or_call.message
-            )
-        else:
-            ok, result_msg, total = await self._place_multiple_bets(
-                user_id, chat_id, last_bets, username, message_or_call
-            )
-        if not ok and hasattr(message_or_call, 'answer'):
+        # Ответы на ставки идут в сообщение: у callback это сообщение с кнопками
+        reply_target = (message_or_call.message if isinstance(message_or_call, types.CallbackQuery)
+                        else message_or_call)
+        ok, result_msg, total = await self._place_multiple_bets(
+            user_id, chat_id, last_bets, username, reply_target
+        )
+        if not ok:
             await message_or_call.answer(result_msg)
 
     async def _double_bets(self, user_id: int, chat_id: int, message_or_call):
         """Удваивает текущие ставки пользователя"""
         session = self.session_manager.get_session(chat_id)
-        username = get_display_name(
-            message_or_call.from_user if hasattr(message_or_call, 'from_user')
-            else message_or_call
-        )
-        if user_id not in session.user_sessions or not session.user_sessions[user_id].has_bets:
-            reply_method = getattr(message_or_call, 'answer', message_or_call.answer)
+        username = get_display_name(message_or_call.from_user)
+        user_session = session.user_sessions.get(user_id)
+        if not (user_session and user_session.has_bets):
+            reply_method = message_or_call.answer
             await reply_method("❌ Нет активных ставок для удвоения")
             return
 
-        user_session = session.user_sessions[user_id]
         async with DatabaseManager.db_session() as db:
             user = UserRepository.get_user_by_telegram_id(db, user_id)
             if not user:
-                reply_method = getattr(message_or_call, 'answer', message_or_call.answer)
+                reply_method = message_or_call.answer
                 await reply_method("❌ Пользователь не найден")
                 return
 
             double_amount = user_session.total_amount
             if double_amount > user.coins:
-                reply_method = getattr(message_or_call, 'answer', message_or_call.answer)
+                reply_method = message_or_call.answer
                 await reply_method(
                     f"❌ Недостаточно средств для удвоения. Нужно: {double_amount}, есть: {user.coins}")
                 return
@@ -782,32 +763,20 @@ class RouletteHandler:
                                   for amount, bet_type, value in doubled_bets]
             double_text = f"ᅠᅠ удвоил(а) ставки:\n" + "\n".join(bet_display_values)
 
-            if hasattr(message_or_call, 'message'):
-                ok, result_msg, total = await self._place_multiple_bets_silent(
-                    user_id, chat_id, doubled_bets, username, message_or_call.message
-                )
-                if ok:
-                    try:
-                        msg = await message_or_call.message.answer(double_text, parse_mode="Markdown")
-                        user_session = session.get_user_session(user_id, username)
-                        user_session.bet_message_ids.append(msg.message_id)
-                    except Exception as e:
-                        logger.error(f"Ошибка при создании сообщения: {e}")
-                else:
-                    await message_or_call.answer(f"❌ {result_msg}")
+            is_callback = isinstance(message_or_call, types.CallbackQuery)
+            reply_target = message_or_call.message if is_callback else message_or_call
+            ok, result_msg, total = await self._place_multiple_bets_silent(
+                user_id, chat_id, doubled_bets, username, reply_target
+            )
+            if ok:
+                try:
+                    msg = await reply_target.answer(double_text, parse_mode="Markdown")
+                    user_session = session.get_user_session(user_id, username)
+                    user_session.bet_message_ids.append(msg.message_id)
+                except Exception as e:
+                    logger.error(f"Ошибка при создании сообщения: {e}")
             else:
-                ok, result_msg, total = await self._place_multiple_bets_silent(
-                    user_id, chat_id, doubled_bets, username, message_or_call
-                )
-                if ok:
-                    try:
-                        msg = await message_or_call.answer(double_text, parse_mode="Markdown")
-                        user_session = session.get_user_session(user_id, username)
-                        user_session.bet_message_ids.append(msg.message_id)
-                    except Exception as e:
-                        logger.error(f"Ошибка при создании сообщения: {e}")
-                else:
-                    await message_or_call.answer(result_msg)
+                await message_or_call.answer(f"❌ {result_msg}" if is_callback else result_msg)
 
     async def _place_multiple_bets_silent(self, user_id: int, chat_id: int, bets: List[Tuple[int, str, str]],
                                           username: str, reply_target: types.Message) -> Tuple[bool, str, int]:
@@ -821,34 +790,35 @@ class RouletteHandler:
             user_session = session.get_user_session(user_id, username)
             successful_bets = []
             total_amount = 0
+            max_amount = 0
             for amount, bet_type, bet_value in bets:
                 is_valid, error_msg = BetValidator.validate_bet(amount, coins, user_session.total_amount)
                 if not is_valid:
+                    # Уже принятые ставки остаются в сессии — их сумму нужно списать
+                    if successful_bets:
+                        UserRepository.apply_bets(db, user_id, coins, max_amount)
                     return False, error_msg, 0
-                bet = Bet(amount, bet_type, bet_value, username, user_id)
+                bet = BET_POOL.acquire(amount, bet_type, bet_value, username, user_id)
                 if user_session.add_bet(bet):
                     coins -= amount
                     total_amount += amount
                     successful_bets.append(bet)
-                    UserRepository.update_user_balance(db, user_id, coins)
-                    UserRepository.update_max_bet(db, user_id, amount)
+                    max_amount = max(max_amount, amount)
 
             if not successful_bets:
                 return False, "❌ Не удалось разместить ни одну ставку", 0
+            UserRepository.apply_bets(db, user_id, coins, max_amount)
 
-            if not getattr(session, 'is_doubling_operation', False):
+            if not session.is_doubling_operation:
                 session.last_user_bets[user_id] = bets
             session.is_doubling_operation = False
             return True, "", total_amount
 
     async def check_spin_limit(self, user_id: int, chat_id: int, message: types.Message) -> bool:
         """Проверяет лимит прокрутов в конкретном чате"""
-        can_spin, remaining = roulette_limit_manager.can_spin_roulette_in_chat(user_id, chat_id)
-        if not can_spin:
-            limit_info = roulette_limit_manager.get_spin_info_for_chat(user_id, chat_id)
-            # Проверяем, снят ли уже лимит
-            if roulette_limit_manager.has_roulette_limit_removed_in_chat(user_id, chat_id):
-                return True
+        limit_state = roulette_limit_manager.get_limit_state(user_id, chat_id)
+        if not limit_state.can_spin:
+            limit_info = roulette_limit_manager.get_spin_info_for_chat(user_id, chat_id, limit_state)
             # Показываем кнопку покупки только если лимит НЕ снят
             keyboard = InlineKeyboardMarkup().add(
                 InlineKeyboardButton("🛍️ Купить снятие лимита", callback_data="back_to_shop")
@@ -860,18 +830,92 @@ class RouletteHandler:
             return False
         return True
 
+    # Текстовые команды: собираются один раз при определении класса, вызываются как handler(self, message)
+    _COMMAND_HANDLERS = {
+        "го": spin_roulette,
+        "крутить": spin_roulette,
+        "spin": spin_roulette,
+        "отмена": clear_bets_command,
+        "очистить": clear_bets_command,
+        "clear": clear_bets_command,
+        "ставки": show_my_bets,
+        "мои ставки": show_my_bets,
+        "bets": show_my_bets,
+        "лог": show_logs_command,
+        "!лог": show_all_logs_command,
+        "повторить": repeat_bets_command,
+        "repeat": repeat_bets_command,
+        "удвоить": double_bets_command,
+        "удвой": double_bets_command,
+        "double": double_bets_command,
+        "лимит рулетки": show_limits,
+        "limit roulette": show_limits,
+        "лимиты": _show_transfer_limits,
+        "лимит": _show_transfer_limits,
+        "limits": _show_transfer_limits,
+    }
+
 
 # =============================================================================
 # РЕГИСТРАЦИЯ ОБРАБОТЧИКОВ
 # =============================================================================
+# Слова-триггеры фильтров: проверка — один поиск в множестве
+_BALANCE_TRIGGERS = frozenset({"б", "баланс", "balance"})
+_SPIN_TRIGGERS = frozenset({"го", "крутить", "spin"})
+_CLEAR_TRIGGERS = frozenset({"отмена", "очистить", "clear", "отменить"})
+_BETS_TRIGGERS = frozenset({"ставки", "мои ставки", "bets"})
+_REPEAT_TRIGGERS = frozenset({"повторить", "repeat", "репит"})
+_DOUBLE_TRIGGERS = frozenset({"удвоить", "удвой", "double", "дабл"})
+_LIMIT_TRIGGERS = frozenset({"лимит рулетки", "limit roulette"})
+_CALLBACK_PREFIXES = ("bet:", "quick:", "action:")
+
+# Признаки ставки одним регулярным выражением (текст уже в нижнем регистре):
+# ключевые слова где угодно в тексте, ва-банк в начале, число с суммой в начале или диапазон
+_BET_TEXT_RE = re.compile(
+    r"на|ставк[аиу]|красн|черн|зелен|кр |ч |з "
+    r"|^(?:ва-банк|вабанк|ва банк)"
+    r"|^\d+\s*[kк]?\s+"
+    r"|\d+\s*-\s*\d+"
+)
+
+
+def _text_lower(message: types.Message) -> str:
+    """Текст сообщения в нижнем регистре; считается один раз на сообщение для всей цепочки фильтров"""
+    text_lower = message.conf.get('text_lower')
+    if text_lower is None:
+        text_lower = message.conf['text_lower'] = message.text.lower() if message.text else ""
+    return text_lower
+
+
+def _looks_like_bet(message: types.Message) -> bool:
+    """Фильтр текстовых ставок: один проход регулярного выражения по кэшированному lower()"""
+    text_lower = _text_lower(message)
+    return bool(text_lower) and _BET_TEXT_RE.search(text_lower) is not None
+
+
+# Обработчик, зарегистрированный в диспетчере (останавливается в on_shutdown)
+_registered_handler: Optional[RouletteHandler] = None
+
+
+async def shutdown_roulette_handlers():
+    """Останавливает фоновые задачи рулетки и дописывает буфер логов в БД"""
+    if _registered_handler is not None:
+        await _registered_handler.shutdown()
+    else:
+        roulette_logger.flush()
+
+
 def register_roulette_handlers(dp):
     """Регистрирует обработчики рулетки"""
-    handler = RouletteHandler()
+    global _registered_handler
+    handler = _registered_handler = RouletteHandler()
+    # Фоновые задачи очистки (антифлуд, сессии) живут отдельно от обработки сообщений
+    asyncio.create_task(handler.initialize())
 
     # Основные команды
     dp.register_message_handler(
         handler.show_balance,
-        lambda m: m.text and m.text.strip().lower() in ["б", "баланс", "balance"]
+        lambda m: _text_lower(m).strip() in _BALANCE_TRIGGERS
     )
     dp.register_message_handler(
         handler.start_roulette,
@@ -879,63 +923,53 @@ def register_roulette_handlers(dp):
     )
     dp.register_message_handler(
         handler.start_roulette,
-        lambda m: m.text and m.text.lower() == "рулетка"
+        lambda m: _text_lower(m) == "рулетка"
     )
     dp.register_message_handler(
         handler.quick_start_roulette,
-        lambda m: m.text and m.text.lower() in ["го", "крутить", "spin"]
+        lambda m: _text_lower(m) in _SPIN_TRIGGERS
     )
 
     # Команды управления ставками
     dp.register_message_handler(
         handler.clear_bets_command,
-        lambda m: m.text and m.text.lower() in ["отмена", "очистить", "clear", "отменить"]
+        lambda m: _text_lower(m) in _CLEAR_TRIGGERS
     )
     dp.register_message_handler(
         handler.show_my_bets,
-        lambda m: m.text and m.text.lower() in ["ставки", "мои ставки", "bets"]
+        lambda m: _text_lower(m) in _BETS_TRIGGERS
     )
 
     # Команды повторения и удвоения
     dp.register_message_handler(
-        lambda m: handler._repeat_last_bets(m.from_user.id, m.chat.id, m),
-        lambda m: m.text and m.text.lower() in ["повторить", "repeat", "репит"]
+        handler.repeat_bets_command,
+        lambda m: _text_lower(m) in _REPEAT_TRIGGERS
     )
     dp.register_message_handler(
-        lambda m: handler._double_bets(m.from_user.id, m.chat.id, m),
-        lambda m: m.text and m.text.lower() in ["удвоить", "удвой", "double", "дабл"]
+        handler.double_bets_command,
+        lambda m: _text_lower(m) in _DOUBLE_TRIGGERS
     )
 
     # Команды логов
     dp.register_message_handler(
-        lambda m: handler.show_logs_command(m, False),
-        lambda m: m.text and m.text.lower() == "лог"
+        handler.show_logs_command,
+        lambda m: _text_lower(m) == "лог"
     )
     dp.register_message_handler(
-        lambda m: handler.show_logs_command(m, True),
-        lambda m: m.text and m.text.lower() == "!лог"
+        handler.show_all_logs_command,
+        lambda m: _text_lower(m) == "!лог"
     )
 
     # Лимиты рулетки
     dp.register_message_handler(
         handler.show_limits,
-        lambda m: m.text and m.text.lower() in ["лимит рулетки", "limit roulette"]
+        lambda m: _text_lower(m) in _LIMIT_TRIGGERS
     )
 
     # Текстовые ставки
-    BET_PATTERNS = [
-        r'^\d+\s*[kк]?\s+',  # Сообщения, начинающиеся с чисел
-        r'\d+\s*-\s*\d+',    # Сообщения с диапазонами
-    ]
-    BET_KEYWORDS = ["на", "ставка", "ставку", "ставки", "красн", "черн", "зелен", "кр ", "ч ", "з "]
-    VABANK_KEYWORDS = ["ва-банк", "вабанк", "ва банк"]
     dp.register_message_handler(
         handler.place_bet,
-        lambda m: m.text and (
-                any(word in m.text.lower() for word in BET_KEYWORDS) or
-                any(m.text.lower().startswith(keyword) for keyword in VABANK_KEYWORDS) or
-                any(re.search(pattern, m.text.lower()) for pattern in BET_PATTERNS)
-        ),
+        _looks_like_bet,
         content_types=["text"],
         state="*"
     )
@@ -943,7 +977,7 @@ def register_roulette_handlers(dp):
     # Обработчики callback
     dp.register_callback_query_handler(
         handler.handle_callback,
-        lambda c: c.data and any(c.data.startswith(prefix) for prefix in ["bet:", "quick:", "action:"])
+        lambda c: c.data and c.data.startswith(_CALLBACK_PREFIXES)
     )
 
     return handler
\ No newline at end of file
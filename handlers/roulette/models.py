@@ -1,27 +1,34 @@
 from __future__ import annotations
-from dataclasses import dataclass
+import io
+import sys
+import time
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Sequence
 
 from .config import CONFIG
 
 
-@dataclass
 class Bet:
-    amount: int
-    type: str
-    value: Any
-    username: str
-    user_id: int
-    timestamp: datetime = None
-
-    def __post_init__(self):
-        if self.timestamp is None:
-            self.timestamp = datetime.now()
+    __slots__ = ('amount', 'type', 'value', 'username', 'user_id', 'timestamp')
+
+    def __init__(self, amount: int, type: str, value: Any, username: str, user_id: int,
+                 timestamp: float = None):
+        self.amount = amount
+        # Тип ставки интернируется: сравнения с "цвет"/"число"/"группа" идут по ссылке
+        self.type = sys.intern(type)
+        self.value = value
+        self.username = username
+        self.user_id = user_id
+        # Unix-время float: datetime собирается только при сериализации
+        self.timestamp = timestamp if timestamp is not None else time.time()
 
     def __str__(self) -> str:
         return f"{self.amount} на {self.value} ({self.type})"
 
+    def __repr__(self) -> str:
+        return (f"Bet(amount={self.amount!r}, type={self.type!r}, value={self.value!r}, "
+                f"username={self.username!r}, user_id={self.user_id!r}, timestamp={self.timestamp!r})")
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "amount": self.amount,
@@ -29,41 +36,89 @@ class Bet:
             "value": self.value,
             "username": self.username,
             "user_id": self.user_id,
-            "timestamp": self.timestamp.isoformat()
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+    def as_db_row(self, result_number: int, profit: int) -> Dict[str, Any]:
+        """Строка roulette_transactions для пакетного INSERT (время ставит сервер БД)"""
+        return {
+            'user_id': self.user_id,
+            'amount': self.amount,
+            'is_win': profit > 0,
+            'bet_type': self.type,
+            'bet_value': str(self.value),
+            'result_number': result_number,
+            'profit': profit
         }
 
     def is_same_bet(self, other_bet: 'Bet') -> bool:
         return self.type == other_bet.type and self.value == other_bet.value
 
 
+class BetPool:
+    """Пул объектов Bet: сыгранные ставки переиспользуются вместо новых аллокаций"""
+    __slots__ = ('_free', 'max_size')
+
+    def __init__(self, max_size: int = 1024):
+        self._free: List[Bet] = []
+        self.max_size = max_size
+
+    def acquire(self, amount: int, type: str, value: Any, username: str, user_id: int) -> Bet:
+        if not self._free:
+            return Bet(amount, type, value, username, user_id)
+        bet = self._free.pop()
+        bet.amount = amount
+        bet.type = sys.intern(type)
+        bet.value = value
+        bet.username = username
+        bet.user_id = user_id
+        bet.timestamp = time.time()
+        return bet
+
+    def release(self, bets: List[Bet]):
+        """Возвращает ставки в пул; вызывающий больше не должен их использовать"""
+        free = self.max_size - len(self._free)
+        if free > 0:
+            self._free.extend(bets[:free])
+
+
+BET_POOL = BetPool()
+
+
 class UserBetSession:
-    __slots__ = ('user_id', 'username', 'bets', 'total_amount', 'last_update', 'bet_message_ids')
+    __slots__ = ('user_id', 'username', 'bets', 'total_amount', 'last_update', 'bet_message_ids', '_bet_index')
 
     def __init__(self, user_id: int, username: str):
         self.user_id = user_id
         self.username = username
         self.bets: List[Bet] = []
         self.total_amount = 0
-        self.last_update = datetime.now()
+        self.last_update = time.monotonic()
         self.bet_message_ids: List[int] = []
+        # (тип, значение) -> ставка из self.bets: повторная ставка на то же поле сливается за O(1)
+        self._bet_index: Dict[Tuple[str, Any], Bet] = {}
 
     def add_bet(self, bet: Bet) -> bool:
-        for existing_bet in self.bets:
-            if existing_bet.is_same_bet(bet):
-                existing_bet.amount += bet.amount
-                self.total_amount += bet.amount
-                self.last_update = datetime.now()
-                return True
+        key = (bet.type, bet.value)
+        existing_bet = self._bet_index.get(key)
+        if existing_bet is not None:
+            existing_bet.amount += bet.amount
+            self.total_amount += bet.amount
+            self.last_update = time.monotonic()
+            return True
+        self._bet_index[key] = bet
         self.bets.append(bet)
         self.total_amount += bet.amount
-        self.last_update = datetime.now()
+        self.last_update = time.monotonic()
         return True
 
     def clear_bets(self) -> int:
         total = self.total_amount
+        BET_POOL.release(self.bets)
         self.bets.clear()
+        self._bet_index.clear()
         self.total_amount = 0
-        self.last_update = datetime.now()
+        self.last_update = time.monotonic()
         return total
 
     @property
@@ -73,47 +128,45 @@ class UserBetSession:
     def get_bets_info(self) -> str:
         if not self.bets:
             return "Нет активных ставок"
-        lines = []
+        buf = io.StringIO()
+        w = buf.write
         for bet in self.bets:
             plain_name = bet.username  # formatter moved to handlers/utils
-            lines.append(f"{plain_name} {bet.amount} на {bet.value}")
-        lines.append(f"💰 Общая сумма: {self.total_amount}")
-        return "\n".join(lines)
+            w(f"{plain_name} {bet.amount} на {bet.value}\n")
+        w(f"💰 Общая сумма: {self.total_amount}")
+        return buf.getvalue()
 
 
 class ChatSession:
     __slots__ = ('chat_id', 'user_sessions', 'waiting_for_bet', 'last_user_bets',
                  'created_at', 'last_spin', 'spin_message_id', 'game_logs',
-                 'is_doubling_operation', 'is_spinning', 'spin_lock')
+                 'is_doubling_operation', 'spin_lock')
 
     def __init__(self, chat_id: int):
         import asyncio
         self.chat_id = chat_id
         self.user_sessions: Dict[int, UserBetSession] = {}
         self.waiting_for_bet: Dict[int, Tuple[str, str]] = {}
-        self.last_user_bets: Dict[int, List[Tuple]] = {}
-        self.created_at = datetime.now()
+        self.last_user_bets: Dict[int, Sequence[Tuple]] = {}
+        # Монотонное время: нужно только для сравнения возраста сессии
+        self.created_at = time.monotonic()
         self.last_spin = None
         self.spin_message_id: Optional[int] = None
         self.game_logs: List[Dict] = []
         self.is_doubling_operation = False
-        self.is_spinning = False
         self.spin_lock = asyncio.Lock()
 
     def get_user_session(self, user_id: int, username: str) -> UserBetSession:
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = UserBetSession(user_id, username)
+        user_session = self.user_sessions.get(user_id)
+        if user_session is None:
+            user_session = self.user_sessions[user_id] = UserBetSession(user_id, username)
         else:
-            self.user_sessions[user_id].username = username
-        return self.user_sessions[user_id]
+            user_session.username = username
+        return user_session
 
     def clear_user_session(self, user_id: int) -> int:
-        if user_id in self.user_sessions:
-            session = self.user_sessions[user_id]
-            total = session.total_amount
-            del self.user_sessions[user_id]
-            return total
-        return 0
+        session = self.user_sessions.pop(user_id, None)
+        return session.total_amount if session is not None else 0
 
     @property
     def active_users(self) -> Dict[int, UserBetSession]:
@@ -121,19 +174,22 @@ class ChatSession:
 
 
 class SessionManager:
+    __slots__ = ('sessions',)
+
     def __init__(self):
         self.sessions: Dict[int, ChatSession] = {}
 
     def get_session(self, chat_id: int) -> ChatSession:
-        if chat_id not in self.sessions:
-            self.sessions[chat_id] = ChatSession(chat_id)
-        return self.sessions[chat_id]
+        session = self.sessions.get(chat_id)
+        if session is None:
+            session = self.sessions[chat_id] = ChatSession(chat_id)
+        return session
 
     def cleanup_old_sessions(self, max_age_hours: int = 24):
-        cutoff_time = datetime.now().timestamp() - (max_age_hours * 3600)
+        cutoff_time = time.monotonic() - max_age_hours * 3600
         old_chats = [
             chat_id for chat_id, session in self.sessions.items()
-            if session.created_at.timestamp() < cutoff_time and not session.active_users
+            if session.created_at < cutoff_time and not session.active_users
         ]
         for chat_id in old_chats:
             del self.sessions[chat_id]
\ No newline at end of file
@@ -1,15 +1,16 @@
 # utils.py
 import asyncio
+import sys
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Tuple, Optional, Any
-from decimal import Decimal, ROUND_DOWN
 from aiogram import types
 from aiogram.utils.exceptions import BadRequest
 from config import bot
 from main import logger
 
-from .validators import UserFormatter
-from .config import CONFIG
+from .validators import UserFormatter, BetParser
+from .config import CONFIG, PAYOUT_SCALE
 
 
 # =============================================================================
@@ -18,12 +19,17 @@ from .config import CONFIG
 
 def get_display_name(user: types.User) -> str:
     """Возвращает отображаемое имя пользователя (без ссылки)"""
-    if user.first_name:
-        return user.first_name
-    elif user.username:
-        return f"@{user.username}"
+    return _display_name(user.id, user.first_name, user.username)
+
+
+@lru_cache(maxsize=2048)
+def _display_name(user_id: int, first_name: Optional[str], username: Optional[str]) -> str:
+    if first_name:
+        return first_name
+    elif username:
+        return f"@{username}"
     else:
-        return f"Пользователь {user.id}"
+        return f"Пользователь {user_id}"
 
 
 def format_username_with_link(user_id: int, username: str) -> str:
@@ -31,8 +37,9 @@ def format_username_with_link(user_id: int, username: str) -> str:
     return UserFormatter.get_user_link(user_id, username)
 
 
+@lru_cache(maxsize=2048)
 def get_plain_username(username: str) -> str:
-    """Возвращает экранированное имя без ссылки"""
+    """Возвращает экранированное имя без ссылки (имена в чате почти не меняются — результат кэшируется)"""
     return UserFormatter.get_plain_name(username)
 
 
@@ -40,15 +47,24 @@ def get_plain_username(username: str) -> str:
 # УДАЛЕНИЕ СООБЩЕНИЙ
 # =============================================================================
 
+# Не больше 6 одновременных удалений: Telegram всё равно ограничивает частоту запросов,
+# а неограниченный всплеск только упирается в его лимиты
+_DELETE_SEM = asyncio.Semaphore(6)
+
+
+async def _delete_message(chat_id: int, message_id: int):
+    async with _DELETE_SEM:
+        return await bot.delete_message(chat_id=chat_id, message_id=message_id)
+
+
 async def delete_bet_messages(chat_id: int, bet_message_ids: List[int]):
     """Удаляет список сообщений ставок (без доступа к UserBetSession)"""
     if not bet_message_ids:
         return
-    delete_tasks = [
-        bot.delete_message(chat_id=chat_id, message_id=msg_id)
-        for msg_id in bet_message_ids
-    ]
-    results = await asyncio.gather(*delete_tasks, return_exceptions=True)
+    results = await asyncio.gather(
+        *(_delete_message(chat_id, msg_id) for msg_id in bet_message_ids),
+        return_exceptions=True
+    )
     for result in results:
         if isinstance(result, Exception):
             logger.debug(f"[Utils] Не удалось удалить сообщение: {result}")
@@ -77,11 +93,15 @@ def format_wait_time(wait_time: float) -> str:
     return f"{wait_time:.1f} секунд"
 
 
+COLOR_EMOJIS = {"красное": "🔴", "черное": "⚫", "зеленое": "🟢"}
+# Интернированный тип ставки (Bet.type интернируется при создании)
+_COLOR_TYPE = sys.intern("цвет")
+
+
 def get_bet_display_value(bet_type: str, bet_value: Any) -> str:
     """Возвращает отображаемое значение ставки с эмодзи (для удвоения и т.п.)"""
-    if bet_type == "цвет":
-        color_emojis = {"красное": "🔴", "черное": "⚫", "зеленое": "🟢"}
-        return color_emojis.get(bet_value, str(bet_value))
+    if bet_type == _COLOR_TYPE:
+        return COLOR_EMOJIS.get(bet_value, str(bet_value))
     return str(bet_value)
 
 
@@ -93,10 +113,10 @@ def calculate_bet_result(game, bet, result: int) -> Tuple[int, int]:
     :param result: выпавшее число
     :return: (net_profit, total_payout)
     """
-    multiplier = game.get_multiplier(bet.type, bet.value)
-    is_win = game.check_bet(bet.type, bet.value, result)
-    if is_win:
-        gross_profit = int(bet.amount * multiplier)
+    # Маска и множитель ставки — одна запись в готовой таблице игры
+    win_mask, multiplier = game.bet_entry(bet.type, bet.value)
+    if (win_mask >> result) & 1:
+        gross_profit = int(bet.amount) * multiplier // PAYOUT_SCALE
         total_payout = gross_profit
         return gross_profit, total_payout
     else:
@@ -107,34 +127,24 @@ def calculate_bet_result(game, bet, result: int) -> Tuple[int, int]:
 # ПАРСИНГ И ВА-БАНК
 # =============================================================================
 
+@lru_cache(maxsize=64)
 def parse_vabank_bet(bet_value: str) -> Optional[Tuple[str, Any]]:
     """Парсит тип и значение для ва-банк ставки"""
-    color_map = {
-        'к': 'красное', 'кр': 'красное', 'крас': 'красное', 'red': 'красное',
-        'ч': 'черное', 'чер': 'черное', 'black': 'черное',
-        'з': 'зеленое', 'зел': 'зеленое', 'green': 'зеленое', '0': 'зеленое'
-    }
     bet_value = bet_value.lower().strip()
 
     # Число
     if bet_value.isdigit() and 0 <= int(bet_value) <= 12:
         return "число", int(bet_value)
 
-    # Цветы (сокращения + полные)
-    if bet_value in color_map:
-        return "цвет", color_map[bet_value]
-    if bet_value in ['красное', 'черное', 'зеленое']:
+    # Цветы (сокращения + полные) — те же таблицы, что у BetParser
+    if bet_value in BetParser.COLOR_MAP:
+        return "цвет", BetParser.COLOR_MAP[bet_value]
+    if bet_value in ('красное', 'черное', 'зеленое'):
         return "цвет", bet_value
 
     # Группы
-    group_map = {
-        '1-3': '1-3', '13': '1-3',
-        '4-6': '4-6', '46': '4-6',
-        '7-9': '7-9', '79': '7-9',
-        '10-12': '10-12', '1012': '10-12'
-    }
-    if bet_value in group_map:
-        return "группа", group_map[bet_value]
+    if bet_value in BetParser.GROUP_MAP:
+        return "группа", BetParser.GROUP_MAP[bet_value]
     elif '-' in bet_value:
         try:
             start, end = map(int, bet_value.split('-'))
@@ -1,22 +1,31 @@
 import re
+from functools import lru_cache
 from decimal import Decimal, ROUND_DOWN
 from typing import Tuple, List, Optional, Dict, Any, AsyncIterator
 from contextlib import asynccontextmanager
 from aiogram import types
 
 from .config import CONFIG
+from .game_logic import parse_range
 from database import get_db
-from database.crud import UserRepository
+from database.crud import UserRepository, RouletteRepository
 
 
 class UserFormatter:
     ESCAPE_CHARS = r'_*[]()~`>#+-=|{}.!'
+    # Таблица для str.translate: экранирование за один проход на C вместо генератора по символам
+    _ESCAPE_TABLE = str.maketrans({char: f'\\{char}' for char in ESCAPE_CHARS})
+    # Большинство имён без спецсимволов: их возвращаем как есть, без копии строки
+    _SPECIAL_RE = re.compile(f"[{re.escape(ESCAPE_CHARS)}]")
 
     @staticmethod
     def escape_markdown(text: str) -> str:
-        return ''.join(f'\\{char}' if char in UserFormatter.ESCAPE_CHARS else char for char in text)
+        if UserFormatter._SPECIAL_RE.search(text) is None:
+            return text
+        return text.translate(UserFormatter._ESCAPE_TABLE)
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def get_user_link(user_id: int, display_name: str) -> str:
         safe_name = UserFormatter.escape_markdown(display_name)
         return f"[{safe_name}](tg://user?id={user_id})"
@@ -51,34 +60,42 @@ class DatabaseManager:
             db.close()
 
     @staticmethod
-    async def update_users_batch(user_updates: Dict[int, int], user_stats_updates: Dict[int, Tuple]):
+    def update_users_batch(db, user_updates: Dict[int, int], user_stats_updates: Dict[int, Tuple]):
+        """Переносит балансы и статистику на строки пользователей; коммит делает вызывающий"""
+        # Все строки одним запросом IN, затем один проход по пользователям
+        users = UserRepository.get_users_by_telegram_ids(db, user_updates.keys() | user_stats_updates.keys())
+        for user_id, user in users.items():
+            new_coins = user_updates.get(user_id)
+            if new_coins is not None:
+                user.coins = new_coins
+            stats = user_stats_updates.get(user_id)
+            if stats is not None:
+                win_coins, defeat_coins, max_win, min_win, max_bet = stats  # ← 5 элементов
+                if win_coins is not None:
+                    user.win_coins = win_coins
+                if defeat_coins is not None:
+                    user.defeat_coins = defeat_coins
+                if max_win is not None:
+                    user.max_win_coins = max_win
+                if min_win is not None:
+                    user.min_win_coins = min_win
+                if max_bet is not None:  # ← добавлено
+                    user.max_bet_coins = max_bet
+
+    @staticmethod
+    async def finalize_spin(db, user_updates: Dict[int, int], user_stats_updates: Dict[int, Tuple],
+                            transactions_data: List[Dict]):
+        """Фиксирует итог спина одной транзакцией: балансы, статистика и записи ставок"""
         from main import logger
-        async with DatabaseManager.db_session() as db:
-            try:
-                for user_id, new_coins in user_updates.items():
-                    user = UserRepository.get_user_by_telegram_id(db, user_id)
-                    if user:
-                        user.coins = new_coins
-                for user_id, stats in user_stats_updates.items():
-                    user = UserRepository.get_user_by_telegram_id(db, user_id)
-                    if user:
-                        win_coins, defeat_coins, max_win, min_win, max_bet = stats  # ← 5 элементов
-                        if win_coins is not None:
-                            user.win_coins = win_coins
-                        if defeat_coins is not None:
-                            user.defeat_coins = defeat_coins
-                        if max_win is not None:
-                            user.max_win_coins = max_win
-                        if min_win is not None:
-                            user.min_win_coins = min_win
-                        if max_bet is not None:  # ← добавлено
-                            user.max_bet_coins = max_bet
-                db.commit()
-                logger.info(f"✅ Пакетное обновление: {len(user_updates)} пользователей")
-            except Exception as e:
-                db.rollback()
-                logger.error(f"❌ Ошибка пакетного обновления БД: {e}")
-                raise
+        try:
+            DatabaseManager.update_users_batch(db, user_updates, user_stats_updates)
+            RouletteRepository.create_roulette_transactions(db, transactions_data, commit=False)
+            db.commit()
+            logger.info(f"✅ Пакетное обновление: {len(user_updates)} пользователей")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Ошибка пакетного обновления БД: {e}")
+            raise
 
 
 class BetValidator:
@@ -110,7 +127,11 @@ class BetParser:
         '10-12': '10-12', '1012': '10-12'
     }
 
+    # Шаблоны компилируются один раз; parse_single_bet кэширует результат по тексту —
+    # одинаковые ставки вроде "1000 красное" в чате повторяются постоянно
     AMOUNT_PATTERN = re.compile(r"^(\d+)(k|к)?$", re.IGNORECASE)
+    # Вся ставка целиком: сумма (с необязательным "к"), пробелы, цель
+    SINGLE_BET_PATTERN = re.compile(r"^\s*(\d+)(k|к)?\s+(.+?)\s*$")
     MULTIPLE_BETS_PATTERN = re.compile(r'[,и]+\s*')
     CLEAN_PATTERN = re.compile(r'\s+на\s+')
 
@@ -126,30 +147,28 @@ class BetParser:
         return value * 1000 if match.group(2) else value
 
     @staticmethod
+    @lru_cache(maxsize=256)
     def parse_single_bet(text: str) -> Tuple[Optional[int], Optional[str], Optional[str]]:
         if not text:
             return None, None, None
-        text = ' '.join(text.strip().split())
-        parts = text.lower().split()
-        if len(parts) < 2:
-            return None, None, None
-        amount = BetParser.parse_amount(parts[0])
-        if amount is None:
+        match = BetParser.SINGLE_BET_PATTERN.match(text.lower())
+        if not match:
             return None, None, None
-        target = ' '.join(parts[1:])
+        amount = int(match.group(1))
+        if match.group(2):
+            amount *= 1000
+        # Внутренние пробелы цели схлопываются, как при разборе по словам
+        target = ' '.join(match.group(3).split())
         if target in BetParser.COLOR_MAP:
             return amount, "цвет", BetParser.COLOR_MAP[target]
-        if target.isdigit() and 0 <= int(target) <= 12:
+        if target.isdecimal() and 0 <= int(target) <= 12:
             return amount, "число", int(target)
         if target in BetParser.GROUP_MAP:
             return amount, "группа", BetParser.GROUP_MAP[target]
         if '-' in target:
-            try:
-                start, end = map(int, target.split('-'))
-                if 0 <= start <= 12 and 0 <= end <= 12 and start < end:
-                    return amount, "группа", f"{start}-{end}"
-            except (ValueError, TypeError):
-                pass
+            bounds = parse_range(target)
+            if bounds:
+                return amount, "группа", f"{bounds[0]}-{bounds[1]}"
         return None, None, None
 
     @staticmethod
@@ -1,201 +1,157 @@
+from dataclasses import dataclass
 from sqlalchemy.orm import Session
-from datetime import datetime, date, timedelta
+from datetime import date
 from typing import Tuple, Optional, Dict
-from database import get_db
-from database.crud import ShopRepository, RouletteLimitRepository
-import database.models as models
+from database.session import db_session
+from database.crud import RouletteLimitRepository
+from database.priv_cache import get_active_purchases_cached
+
+
+@dataclass(frozen=True)
+class LimitState:
+    """Состояние лимита пользователя в чате: считается одним проходом и переиспользуется"""
+    has_unlimited: bool
+    today_spins: int
+    remaining: int  # -1 означает безлимит
+
+    @property
+    def can_spin(self) -> bool:
+        return self.has_unlimited or self.remaining > 0
 
 
 class RouletteLimitManager:
     def __init__(self):
         self.limit_per_day = 30
-        self.unlimited_items = [7]  # Товары дающие безлимит
+        self.unlimited_items = frozenset({7})  # Товары дающие безлимит
 
     def _get_today_date(self) -> date:
         """Возвращает сегодняшнюю дату"""
         return date.today()
 
-    def has_roulette_limit_removed_in_chat(self, user_id: int, chat_id: int) -> bool:
-        """Проверяет безлимитный доступ к рулетке"""
-        db = next(get_db())
+    def _has_unlimited(self, db: Session, user_id: int) -> bool:
+        """Безлимит по активным покупкам (кэш привилегий, не больше одного запроса)"""
+        return not self.unlimited_items.isdisjoint(get_active_purchases_cached(db, user_id))
+
+    def _today_spins(self, db: Session, user_id: int, chat_id: int) -> int:
+        """Прокруты пользователя за сегодня в чате (0 при ошибке чтения)"""
         try:
-            print(f"🔍 ДЕТАЛЬНАЯ ПРОВЕРКА БЕЗЛИМИТА:")
-            print(f"   👤 Пользователь: {user_id}")
-            print(f"   💬 Чат: {chat_id}")
-
-            # Способ 1: Проверка через has_active_purchase (глобальная)
-            for item_id in self.unlimited_items:
-                if ShopRepository.has_active_purchase(db, user_id, item_id):
-                    print(f"   ✅ Способ 1: Глобальный безлимит (товар {item_id})")
-                    return True
+            return RouletteLimitRepository.get_today_spin_count(db, user_id, chat_id)
+        except Exception as e:
+            print(f"❌ Ошибка получения количества прокрутов: {e}")
+            return 0
 
-            # Способ 2: Проверка через get_active_purchases
-            active_purchases = ShopRepository.get_active_purchases(db, user_id)
-            print(f"   🛍️ Все активные покупки: {active_purchases}")
+    def _compute_state(self, db: Session, user_id: int, chat_id: int) -> LimitState:
+        """Не больше одного запроса покупок и одного запроса счётчика прокрутов"""
+        if self._has_unlimited(db, user_id):
+            return LimitState(has_unlimited=True, today_spins=0, remaining=-1)
+        today_spins = self._today_spins(db, user_id, chat_id)
+        remaining = max(self.limit_per_day - today_spins, 0)
+        return LimitState(has_unlimited=False, today_spins=today_spins, remaining=remaining)
 
-            for item_id in self.unlimited_items:
-                if item_id in active_purchases:
-                    print(f"   ✅ Способ 2: Безлимит через активные покупки (товар {item_id})")
-                    return True
-
-            print(f"   ❌ Все способы проверки: БЕЗЛИМИТА НЕТ")
-            return False
+    def get_limit_state(self, user_id: int, chat_id: int) -> LimitState:
+        """Возвращает состояние лимита пользователя в конкретном чате"""
+        with db_session() as db:
+            return self._compute_state(db, user_id, chat_id)
 
+    def has_roulette_limit_removed_in_chat(self, user_id: int, chat_id: int) -> bool:
+        """Проверяет безлимитный доступ к рулетке"""
+        try:
+            with db_session() as db:
+                return self._has_unlimited(db, user_id)
         except Exception as e:
-            print(f"❌ Ошибка детальной проверки безлимита: {e}")
+            print(f"❌ Ошибка проверки безлимита: {e}")
             return False
-        finally:
-            db.close()
 
     def get_today_spin_count_in_chat(self, user_id: int, chat_id: int) -> int:
         """Возвращает количество прокрутов пользователя за сегодня в конкретном чате"""
-        db = next(get_db())
-        try:
-            today = self._get_today_date()
-
-            result = db.query(models.RouletteLimit).filter(
-                models.RouletteLimit.user_id == user_id,
-                models.RouletteLimit.chat_id == chat_id,
-                models.RouletteLimit.date == today
-            ).first()
-
-            spin_count = result.spin_count if result else 0
-            return spin_count
+        with db_session() as db:
+            return self._today_spins(db, user_id, chat_id)
 
-        except Exception as e:
-            print(f"❌ Ошибка получения количества прокрутов: {e}")
-            return 0
-        finally:
-            db.close()
-
-    def can_spin_roulette_in_chat(self, user_id: int, chat_id: int) -> Tuple[bool, int]:
+    def can_spin_roulette_in_chat(self, user_id: int, chat_id: int,
+                                  state: Optional[LimitState] = None) -> Tuple[bool, int]:
         """
         Проверяет, может ли пользователь крутить рулетку в конкретном чате
         Возвращает (может_ли_крутить, осталось_прокрутов)
         """
-        print(f"🎰 ПРОВЕРКА ДОСТУПА К РУЛЕТКЕ:")
-        print(f"   👤 Пользователь: {user_id}")
-        print(f"   💬 Чат: {chat_id}")
-
-        # Проверяем безлимитный доступ
-        has_unlimited = self.has_roulette_limit_removed_in_chat(user_id, chat_id)
-
-        if has_unlimited:
-            print(f"   ✅ СТАТУС: БЕЗЛИМИТНЫЙ ДОСТУП")
+        if state is None:
+            state = self.get_limit_state(user_id, chat_id)
+        if state.has_unlimited:
             return True, -1  # -1 означает безлимит
-
-        # Если безлимита нет, проверяем стандартный лимит
-        try:
-            today_spins = self.get_today_spin_count_in_chat(user_id, chat_id)
-            print(f"   📊 Сегодняшние прокруты: {today_spins}")
-
-            # Проверяем не превышен ли лимит
-            if today_spins >= self.limit_per_day:
-                print(f"   ❌ СТАТУС: ЛИМИТ ПРЕВЫШЕН ({today_spins}/{self.limit_per_day})")
-                return False, 0
-
-            remaining = self.limit_per_day - today_spins
-            print(f"   ✅ СТАТУС: ДОСТУП РАЗРЕШЕН ({remaining} осталось)")
-            return True, remaining
-
-        except Exception as e:
-            print(f"   ❌ Ошибка проверки лимита: {e}")
-            # В случае ошибки разрешаем прокрут
-            return True, self.limit_per_day
+        if not state.can_spin:
+            print(f"❌ Лимит рулетки превышен: {user_id} в чате {chat_id} ({state.today_spins}/{self.limit_per_day})")
+            return False, 0
+        return True, state.remaining
 
     def record_spin_in_chat(self, user_id: int, chat_id: int) -> bool:
         """
         Записывает прокрут рулетки в конкретном чате
         Возвращает True если запись успешна, False если лимит превышен
         """
-        # Если пользователь купил снятие лимита - не записываем и всегда разрешаем
-        if self.has_roulette_limit_removed_in_chat(user_id, chat_id):
-            print(f"🎰 Пользователь {user_id} с безлимитом в чате {chat_id} - прокрут разрешен")
-            return True
-
-        can_spin, remaining = self.can_spin_roulette_in_chat(user_id, chat_id)
-        if not can_spin:
-            print(f"❌ Пользователь {user_id} превысил лимит в чате {chat_id}")
-            return False
-
-        db = next(get_db())
         try:
-            # Используем CRUD метод для увеличения счетчика
-            success = RouletteLimitRepository.increment_spin_count(db, user_id, chat_id)
-
-            if success:
-                new_count = self.get_today_spin_count_in_chat(user_id, chat_id)
-                print(f"✅ Записан прокрут для пользователя {user_id} в чате {chat_id}. Всего сегодня: {new_count}")
-            else:
-                print(f"❌ Ошибка записи прокрута для пользователя {user_id} в чате {chat_id}")
-
-            return success
+            # Проверка лимита и запись прокрута идут в одной сессии
+            with db_session() as db:
+                state = self._compute_state(db, user_id, chat_id)
+                # Если пользователь купил снятие лимита - не записываем и всегда разрешаем
+                if state.has_unlimited:
+                    return True
+                if not state.can_spin:
+                    print(f"❌ Пользователь {user_id} превысил лимит в чате {chat_id}")
+                    return False
+
+                # Используем CRUD метод для увеличения счетчика
+                success = RouletteLimitRepository.increment_spin_count(db, user_id, chat_id)
+                if success:
+                    print(f"✅ Записан прокрут для пользователя {user_id} в чате {chat_id}. "
+                          f"Всего сегодня: {state.today_spins + 1}")
+                else:
+                    print(f"❌ Ошибка записи прокрута для пользователя {user_id} в чате {chat_id}")
+                return success
 
         except Exception as e:
             print(f"❌ Ошибка записи прокрута для чата: {e}")
-            db.rollback()
             return False
-        finally:
-            db.close()
 
-    def get_spin_info_for_chat(self, user_id: int, chat_id: int) -> str:
+    def get_spin_info_for_chat(self, user_id: int, chat_id: int,
+                               state: Optional[LimitState] = None) -> str:
         """Возвращает информацию о лимитах пользователя в конкретном чате"""
-        if self.has_roulette_limit_removed_in_chat(user_id, chat_id):
+        if state is None:
+            state = self.get_limit_state(user_id, chat_id)
+        if state.has_unlimited:
             return "🔐 Безлимитный доступ к рулетке! Вы можете играть без ограничений!"
 
-        can_spin, remaining = self.can_spin_roulette_in_chat(user_id, chat_id)
-        today_spins = self.get_today_spin_count_in_chat(user_id, chat_id)
-
-        if can_spin:
-            if remaining > 0:
-                return f"🎰 В этом чате осталось прокрутов: {remaining}/{self.limit_per_day} (использовано: {today_spins})"
-            else:
-                return f"🎰 Лимит рулетки в этом чате: {self.limit_per_day} прокрутов в день"
+        if state.can_spin:
+            return (f"🎰 В этом чате осталось прокрутов: {state.remaining}/{self.limit_per_day} "
+                    f"(использовано: {state.today_spins})")
         else:
             return f"❌ Лимит рулетки в этом чате исчерпан! Осталось прокрутов: 0/{self.limit_per_day}"
 
-    def get_remaining_spins_in_chat(self, user_id: int, chat_id: int) -> int:
+    def get_remaining_spins_in_chat(self, user_id: int, chat_id: int,
+                                    state: Optional[LimitState] = None) -> int:
         """Возвращает количество оставшихся прокрутов в конкретном чате"""
-        if self.has_roulette_limit_removed_in_chat(user_id, chat_id):
-            return -1  # Безлимит
-
-        can_spin, remaining = self.can_spin_roulette_in_chat(user_id, chat_id)
-        return remaining if can_spin else 0
+        if state is None:
+            state = self.get_limit_state(user_id, chat_id)
+        return state.remaining
 
     def get_user_chat_limit_stats(self, user_id: int, chat_id: int) -> Dict:
         """Возвращает полную статистику лимитов пользователя в чате"""
-        db = next(get_db())
-        try:
-            # Проверяем существует ли метод в репозитории
-            if hasattr(RouletteLimitRepository, 'get_user_chat_limit_stats'):
+        with db_session() as db:
+            state = self._compute_state(db, user_id, chat_id)
+            try:
                 stats = RouletteLimitRepository.get_user_chat_limit_stats(db, user_id, chat_id)
-            else:
-                # Если метода нет, создаем базовую статистику
+            except Exception as e:
+                print(f"❌ Ошибка получения статистики лимитов для чата: {e}")
                 stats = {
-                    'today_spins': self.get_today_spin_count_in_chat(user_id, chat_id),
+                    'today_spins': state.today_spins,
                     'total_days_in_chat': 0,
                     'total_spins_in_chat': 0
                 }
 
-            stats.update({
-                'has_limit_removed': self.has_roulette_limit_removed_in_chat(user_id, chat_id),
-                'remaining_spins': self.get_remaining_spins_in_chat(user_id, chat_id),
-                'limit_per_day': self.limit_per_day
-            })
-            return stats
-
-        except Exception as e:
-            print(f"❌ Ошибка получения статистики лимитов для чата: {e}")
-            return {
-                'has_limit_removed': self.has_roulette_limit_removed_in_chat(user_id, chat_id),
-                'remaining_spins': self.get_remaining_spins_in_chat(user_id, chat_id),
-                'limit_per_day': self.limit_per_day,
-                'today_spins': 0,
-                'total_days_in_chat': 0,
-                'total_spins_in_chat': 0
-            }
-        finally:
-            db.close()
+        stats.update({
+            'has_limit_removed': state.has_unlimited,
+            'remaining_spins': state.remaining,
+            'limit_per_day': self.limit_per_day
+        })
+        return stats
 
     def cleanup_old_limits(self, db: Session):
         """Очищает старые записи лимитов (старше 7 дней)"""
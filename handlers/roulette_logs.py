@@ -1,25 +1,64 @@
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from collections import deque
+import asyncio
+import atexit
 import logging
-from database import get_db
+from database.session import db_session
 from database.crud import RouletteRepository
 
 
 class RouletteLogger:
     """Класс для логирования результатов рулетки с сохранением в БД"""
+    # Логи пишутся в БД пачками: при накоплении BATCH_SIZE записей или фоном раз в FLUSH_INTERVAL секунд
+    BATCH_SIZE = 64
+    FLUSH_INTERVAL = 2.0
+    MAX_PENDING = 1024  # при недоступной БД дальше этого буфер не растёт
 
     def __init__(self):
         self.chat_logs = {}  # {chat_id: deque} - кэш логов по чатам
+        self.chat_lines = {}  # {chat_id: deque} - готовые строки "эмодзи+число" для команды "лог"
         self.current_date = date.today()
         self.logger = logging.getLogger(__name__)
+        self._pending = []  # строки roulette_game_logs, ещё не записанные в БД
+        self._log_counts = {}  # {chat_id: int} - число логов чата (БД + буфер), COUNT(*) раз на чат
+
+    def flush(self) -> int:
+        """Записывает накопленные логи в БД одним INSERT, возвращает число записанных строк"""
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+        try:
+            with db_session() as db:
+                RouletteRepository.add_game_logs(db, rows, commit=False)
+            return len(rows)
+        except Exception as e:
+            self.logger.error(f"Ошибка пакетной записи логов рулетки: {e}")
+            # Возвращаем строки в буфер, чтобы дописать их при следующей попытке
+            self._pending = (rows + self._pending)[-self.MAX_PENDING:]
+            return 0
+
+    def _maybe_flush(self):
+        # По времени буфер сбрасывает только run_flush_loop, здесь — лишь по размеру пачки
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    async def run_flush_loop(self):
+        """Фоновая дозапись буфера: логи тихих чатов не ждут следующего прокрута"""
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            if self._pending:
+                self.flush()
 
     def add_game_log(self, chat_id: int, result: int, color_emoji: str):
         """Добавляет запись о результате игры в БД и кэш"""
         try:
-            db = next(get_db())
-
-            # Сохраняем в базу данных (постоянное хранение)
-            RouletteRepository.add_game_log(db, chat_id, result, color_emoji)
+            # Ставим в очередь на запись в БД (постоянное хранение), пишется пачкой
+            self._pending.append({
+                "chat_id": chat_id,
+                "result": result,
+                "color_emoji": color_emoji,
+                "created_at": datetime.now(timezone.utc)
+            })
 
             # Также обновляем кэш в памяти для быстрого доступа
             if chat_id not in self.chat_logs:
@@ -34,7 +73,17 @@ class RouletteLogger:
             # ВСЕГДА добавляем новые логи В КОНЕЦ (вниз)
             self.chat_logs[chat_id].append(game_log)
 
+            # Строка форматируется один раз при записи, чтение лишь склеивает готовые строки
+            lines = self.chat_lines.get(chat_id)
+            if lines is None:
+                lines = self.chat_lines[chat_id] = deque(maxlen=50)
+            lines.append(f"{color_emoji}{result}")
+
+            if chat_id in self._log_counts:
+                self._log_counts[chat_id] += 1
+
             self.logger.info(f"Добавлен лог рулетки для чата {chat_id}: {result}{color_emoji}")
+            self._maybe_flush()
 
         except Exception as e:
             self.logger.error(f"Ошибка добавления лога рулетки: {e}")
@@ -50,8 +99,8 @@ class RouletteLogger:
                 return logs[-count:] if len(logs) >= count else logs
 
             # Если в кэше недостаточно данных, берем из БД
-            db = next(get_db())
-            logs = RouletteRepository.get_recent_game_logs(db, chat_id, count)
+            with db_session() as db:
+                logs = RouletteRepository.get_recent_game_logs(db, chat_id, count)
 
             # Преобразуем в нужный формат и НЕ реверсируем
             formatted_logs = []
@@ -68,6 +117,13 @@ class RouletteLogger:
             self.logger.error(f"Ошибка получения логов: {e}")
             return []
 
+    def get_recent_lines(self, chat_id: int, count: int = 10):
+        """Возвращает последние N записей чата готовыми строками (последние снизу)"""
+        lines = self.chat_lines.get(chat_id)
+        if lines:
+            return list(lines)[-count:]
+        return [f"{log['color_emoji']}{log['result']}" for log in self.get_recent_logs(chat_id, count)]
+
     def get_all_logs(self, chat_id: int):
         """Возвращает все логи для чата (до 50, последние снизу)"""
         try:
@@ -78,8 +134,8 @@ class RouletteLogger:
                 return logs
 
             # Если в кэше недостаточно данных, берем из БД
-            db = next(get_db())
-            logs = RouletteRepository.get_recent_game_logs(db, chat_id, 50)
+            with db_session() as db:
+                logs = RouletteRepository.get_recent_game_logs(db, chat_id, 50)
 
             # Преобразуем в нужный формат и НЕ реверсируем
             formatted_logs = []
@@ -97,19 +153,24 @@ class RouletteLogger:
             return []
 
     def get_logs_count(self, chat_id: int):
-        """Возвращает количество записей в логах чата из БД"""
+        """Возвращает количество записей в логах чата (COUNT(*) в БД только при первом запросе)"""
+        count = self._log_counts.get(chat_id)
+        if count is not None:
+            return count
         try:
-            db = next(get_db())
-
             # Получаем количество логов через SQLAlchemy
             from sqlalchemy import func
             from database.models import RouletteGameLog
 
-            count = db.query(func.count(RouletteGameLog.id)).filter(
-                RouletteGameLog.chat_id == chat_id
-            ).scalar()
+            with db_session() as db:
+                count = db.query(func.count(RouletteGameLog.id)).filter(
+                    RouletteGameLog.chat_id == chat_id
+                ).scalar()
 
-            return count if count else 0
+            # Плюс записи, ещё ждущие пакетной записи в БД; дальше счётчик ведёт add_game_log
+            pending = sum(1 for row in self._pending if row["chat_id"] == chat_id)
+            count = self._log_counts[chat_id] = (count or 0) + pending
+            return count
 
         except Exception as e:
             self.logger.error(f"Ошибка подсчета логов: {e}")
@@ -118,23 +179,23 @@ class RouletteLogger:
     def cleanup_old_logs(self, days: int = 30):
         """Очищает старые логи (старше указанного количества дней)"""
         try:
-            db = next(get_db())
             from sqlalchemy import delete
             from database.models import RouletteGameLog
             from datetime import datetime, timedelta
 
             cutoff_date = datetime.now() - timedelta(days=days)
 
-            deleted_count = db.execute(
-                delete(RouletteGameLog).where(
-                    RouletteGameLog.created_at < cutoff_date
-                )
-            ).rowcount
-
-            db.commit()
+            with db_session() as db:
+                deleted_count = db.execute(
+                    delete(RouletteGameLog).where(
+                        RouletteGameLog.created_at < cutoff_date
+                    )
+                ).rowcount
 
             # Также очищаем кэш для всех чатов
             self.chat_logs.clear()
+            self.chat_lines.clear()
+            self._log_counts.clear()
 
             self.logger.info(f"Очищено {deleted_count} старых логов рулетки")
             return deleted_count
@@ -142,3 +203,9 @@ class RouletteLogger:
         except Exception as e:
             self.logger.error(f"Ошибка очистки старых логов: {e}")
             return 0
+
+
+# Единственный логгер рулетки: буфер и кэши общие для всех обработчиков
+roulette_logger = RouletteLogger()
+# Остаток буфера дописывается при завершении процесса
+atexit.register(roulette_logger.flush)
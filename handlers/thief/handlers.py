@@ -4,14 +4,24 @@ from aiogram import types
 from handlers.thief.service import ThiefService
 
 
+# Шаблоны компилируются один раз: фильтр вызывается на каждое сообщение
+_CMD_PREFIX = re.compile(r"^[/!]")
+_CMD_MENTION = re.compile(r"@[\w_]+$")
+_ROB_CMDS = frozenset(("украсть", "ограбить", "воруй"))
+# Первый непробельный символ команды кражи: префикс или первая буква команды
+_ROB_CMD_STARTS = frozenset("/!") | {cmd[0] for cmd in _ROB_CMDS}
+
+
 def normalize_cmd(text: str) -> str:
     """Нормализует команду, убирает лишние пробелы и приводит к нижнему регистру"""
     if not text or not text.strip():
         return ""
 
     # Убираем символы команд и упоминания
-    text = re.sub(r"^[/!]", "", text)
-    text = re.sub(r"@[\w_]+$", "", text)
+    if text[0] in "/!":
+        text = _CMD_PREFIX.sub("", text)
+    if "@" in text:
+        text = _CMD_MENTION.sub("", text)
 
     # Разбиваем на слова и берем первое, если оно есть
     parts = text.strip().lower().split()
@@ -20,11 +30,15 @@ def normalize_cmd(text: str) -> str:
 
 def is_rob_cmd(msg: types.Message):
     """Проверяет, является ли сообщение командой кражи"""
-    if not msg.text or not msg.text.strip():
+    text = msg.text
+    if not text:
+        return False
+    # Быстрый отказ для обычных сообщений: команда начинается с "/", "!" или первой буквы команды
+    stripped = text.lstrip()
+    if not stripped or stripped[0].lower() not in _ROB_CMD_STARTS:
         return False
 
-    normalized_cmd = normalize_cmd(msg.text)
-    return normalized_cmd in ["украсть", "ограбить", "воруй"]
+    return normalize_cmd(text) in _ROB_CMDS
 
 
 async def rob_user(message: types.Message):
@@ -2,8 +2,11 @@
 from datetime import datetime, timedelta
 from typing import Optional, Tuple
 from decimal import Decimal
-from database import get_db
-from database.crud import ShopRepository, UserRepository
+from sqlalchemy import update
+from database.session import db_session
+from database.crud import UserRepository
+from database.models import TelegramUser
+from database.priv_cache import get_active_purchases_cached
 
 
 class ThiefService:
@@ -13,27 +16,23 @@ class ThiefService:
     POLICE_PRIVILEGE_ID = 2
 
     @staticmethod
-    def check_thief_permission(user_id: int) -> bool:
-        db = next(get_db())
-        try:
-            purchases = ShopRepository.get_user_purchases(db, user_id)
-            return ThiefService.THIEF_PRIVILEGE_ID in purchases
-        finally:
-            db.close()
+    def check_thief_permission(user_id: int, db=None) -> bool:
+        if db is not None:
+            return ThiefService.THIEF_PRIVILEGE_ID in get_active_purchases_cached(db, user_id)
+        with db_session() as db:
+            return ThiefService.THIEF_PRIVILEGE_ID in get_active_purchases_cached(db, user_id)
 
     @staticmethod
-    def is_police(user_id: int) -> bool:
-        db = next(get_db())
-        try:
-            purchases = ShopRepository.get_user_purchases(db, user_id)
-            return ThiefService.POLICE_PRIVILEGE_ID in purchases
-        finally:
-            db.close()
+    def is_police(user_id: int, db=None) -> bool:
+        if db is not None:
+            return ThiefService.POLICE_PRIVILEGE_ID in get_active_purchases_cached(db, user_id)
+        with db_session() as db:
+            return ThiefService.POLICE_PRIVILEGE_ID in get_active_purchases_cached(db, user_id)
 
     @staticmethod
-    def is_user_arrested(user_id: int) -> bool:
+    def is_user_arrested(user_id: int, db=None) -> bool:
         from handlers.police.service import PoliceService
-        return PoliceService.is_user_arrested(user_id)
+        return PoliceService.is_user_arrested(user_id, db)
 
     @staticmethod
     def _reset_rob_if_needed(user):
@@ -47,49 +46,63 @@ class ThiefService:
 
     @staticmethod
     def rob_user(thief_id: int, victim_id: int) -> Tuple[bool, str, Optional[float]]:
-        db = next(get_db())
+        # Проверки прав и ареста, сброс счётчика и перевод монет — одна сессия;
+        # db_session фиксирует транзакцию на выходе и откатывает её при ошибке
         try:
-            thief = UserRepository.get_user_by_telegram_id(db, thief_id)
-            victim = UserRepository.get_user_by_telegram_id(db, victim_id)
-            print(f"🔍 [DEBUG] thief type: {type(thief)}")
-            if thief:
-                print(f"🔍 [DEBUG] robberies_today = {getattr(thief, 'robberies_today', 'MISSING')}")
-                print(f"🔍 [DEBUG] has attr 'last_robbery_reset': {hasattr(thief, 'last_robbery_reset')}")
-            else:
-                print("🔍 [DEBUG] thief is None!")
-            if not thief or not victim:
-                return False, "❌ Пользователь не найден", None
-
-            if not ThiefService.check_thief_permission(thief_id):
-                return False, "🎭 Нужна привилегия «Вор в законе»", None
-
-            if thief_id == victim_id:
-                return False, "🚫 Нельзя грабить себя", None
-
-            if ThiefService.is_police(victim_id):
-                return False, "🚓 Нельзя грабить полицейского!", None
-
-            if ThiefService.is_user_arrested(thief_id):
-                return False, "🔒 Вы арестованы!", None
-
-            ThiefService._reset_rob_if_needed(thief)
-            if thief.robberies_today >= ThiefService.MAX_DAILY:
-                return False, f"⏳ Лимит: {ThiefService.MAX_DAILY} раз/день", None
-
-            amount = int(victim.coins * ThiefService.ROB_PERCENT)
-            if amount <= 0:
-                return False, "📉 У жертвы нет денег", None
-
-            victim.coins -= amount
-            thief.coins += amount
-            thief.robberies_today += 1
-            db.commit()
-
-            return True, f"💰 Украдено {amount}₽", amount
-
-
+            with db_session() as db:
+                thief = UserRepository.get_user_by_telegram_id(db, thief_id)
+                victim = UserRepository.get_user_by_telegram_id(db, victim_id)
+                print(f"🔍 [DEBUG] thief type: {type(thief)}")
+                if thief:
+                    print(f"🔍 [DEBUG] robberies_today = {getattr(thief, 'robberies_today', 'MISSING')}")
+                    print(f"🔍 [DEBUG] has attr 'last_robbery_reset': {hasattr(thief, 'last_robbery_reset')}")
+                else:
+                    print("🔍 [DEBUG] thief is None!")
+                if not thief or not victim:
+                    return False, "❌ Пользователь не найден", None
+
+                if not ThiefService.check_thief_permission(thief_id, db):
+                    return False, "🎭 Нужна привилегия «Вор в законе»", None
+
+                if thief_id == victim_id:
+                    return False, "🚫 Нельзя грабить себя", None
+
+                if ThiefService.is_police(victim_id, db):
+                    return False, "🚓 Нельзя грабить полицейского!", None
+
+                if ThiefService.is_user_arrested(thief_id, db):
+                    return False, "🔒 Вы арестованы!", None
+
+                ThiefService._reset_rob_if_needed(thief)
+                if thief.robberies_today >= ThiefService.MAX_DAILY:
+                    return False, f"⏳ Лимит: {ThiefService.MAX_DAILY} раз/день", None
+
+                amount = int(victim.coins * ThiefService.ROB_PERCENT)
+                if amount <= 0:
+                    return False, "📉 У жертвы нет денег", None
+
+                # Сброс дневного счётчика пишем до атомарных UPDATE ниже
+                db.flush()
+
+                # Списание и зачисление — условные UPDATE в БД, а не чтение-изменение-запись:
+                # параллельные кражи не спишут одни и те же монеты дважды и не превысят лимит
+                debit = update(TelegramUser).where(
+                    TelegramUser.id == victim.id, TelegramUser.coins >= amount
+                ).values(coins=TelegramUser.coins - amount)
+                credit = update(TelegramUser).where(
+                    TelegramUser.id == thief.id, TelegramUser.robberies_today < ThiefService.MAX_DAILY
+                ).values(coins=TelegramUser.coins + amount, robberies_today=TelegramUser.robberies_today + 1)
+
+                # Строки блокируются в порядке id, чтобы встречные кражи не взаимоблокировались
+                statements = [(victim.id, debit), (thief.id, credit)]
+                statements.sort(key=lambda item: item[0])
+                for _, statement in statements:
+                    result = db.execute(statement, execution_options={"synchronize_session": False})
+                    if result.rowcount != 1:
+                        db.rollback()
+                        if statement is debit:
+                            return False, "⚠️ Баланс жертвы изменился, попробуйте ещё раз", None
+                        return False, f"⏳ Лимит: {ThiefService.MAX_DAILY} раз/день", None
+                return True, f"💰 Украдено {amount}₽", amount
         except Exception as e:
-            db.rollback()
             return False, f"❌ Ошибка: {e}", None
-        finally:
-            db.close()
\ No newline at end of file
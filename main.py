@@ -21,7 +21,7 @@ from middlewares.throttling import setup_throttling
 from handlers.cleanup_scheduler import CleanupScheduler
 from config import dp
 from database import engine, SessionLocal
-from database.models import Base
+from database.models import Base, User
 
 from handlers.admin.mute_ban import mute_ban_manager
 
@@ -92,6 +92,12 @@ def setup_database() -> bool:
         Base.metadata.create_all(bind=engine)
         logger.info("✅ Все таблицы базы данных созданы")
 
+        # create_all не добавляет индексы в уже существующие таблицы:
+        # индексы топов (chat_id, колонка) на users создаём отдельно
+        for index in User.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        logger.info("✅ Индексы таблицы users проверены")
+
         # Проверяем подключение (синхронно) с использованием text()
         db = SessionLocal()
         try:
@@ -240,6 +246,13 @@ async def on_startup(_):
     logger.info("🧹 Очистка старых данных...")
     cleanup_old_limits()
 
+    try:
+        from handlers.police.service import PoliceService
+        PoliceService.load_arrested_ids()
+        logger.info("✅ Активные аресты загружены в кэш")
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки активных арестов: {e}")
+
     # 2. Регистрация обработчиков
     logger.info("📝 Регистрация обработчиков...")
     global mute_ban_manager
@@ -285,6 +298,14 @@ async def on_shutdown(dp: Dispatcher):
         # Останавливаем планировщик донат-задач
         await stop_donate_scheduler()
 
+        # Останавливаем фоновые задачи рулетки и дописываем буфер логов игр
+        try:
+            from handlers.roulette import shutdown_roulette_handlers
+            await shutdown_roulette_handlers()
+            logger.info("✅ Задачи рулетки остановлены")
+        except Exception as e:
+            logger.error(f"❌ Ошибка остановки задач рулетки: {e}")
+
         # Закрываем соединения с БД
         try:
             from database import engine
@@ -2,7 +2,8 @@
 from aiogram import types
 from aiogram.dispatcher.middlewares import BaseMiddleware
 from database import SessionLocal
-from database.models import User, TelegramUser
+from database.models import TelegramUser
+from handlers.record import sync_user_row
 
 
 class AutoRegisterMiddleware(BaseMiddleware):
@@ -48,37 +49,10 @@ class AutoRegisterMiddleware(BaseMiddleware):
                 if telegram_user.first_name != first_name:
                     telegram_user.first_name = first_name
 
-            # 2. Регистрируем в User (таблица для чатов)
-            user = db.query(User).filter(
-                User.tg_id == user_id,
-                User.chat_id == context_chat_id
-            ).first()
-
-            if not user:
-                # Копируем данные из TelegramUser
-                user = User(
-                    tg_id=user_id,
-                    chat_id=context_chat_id,
-                    username=username,
-                    coins=telegram_user.coins or 0,
-                    win_coins=telegram_user.win_coins or 0,
-                    defeat_coins=telegram_user.defeat_coins or 0,
-                    max_win_coins=telegram_user.max_win_coins or 0,
-                    min_win_coins=telegram_user.min_win_coins or 0,
-                    max_bet_coins=telegram_user.max_bet or 0
-                )
-                db.add(user)
-                print(f"✅ Зарегистрирован новый User в чате {context_chat_id}: {user_id}")
-            else:
-                # Обновляем данные из TelegramUser
-                user.coins = telegram_user.coins or user.coins
-                user.win_coins = telegram_user.win_coins or user.win_coins
-                user.defeat_coins = telegram_user.defeat_coins or user.defeat_coins
-                user.max_win_coins = telegram_user.max_win_coins or user.max_win_coins
-                user.min_win_coins = telegram_user.min_win_coins or user.min_win_coins
-                user.max_bet_coins = telegram_user.max_bet or user.max_bet_coins
-                user.username = username or telegram_user.username or user.username
-
+            # 2. Регистрируем в User (таблица для чатов): проверка SELECT 1, затем INSERT
+            # или UPDATE, который пишет только изменившиеся строки
+            db.flush()
+            sync_user_row(db, user_id, context_chat_id, username)
             db.commit()
 
         except Exception as e: